@@ -0,0 +1,96 @@
+"""Micro-benchmark of the db layer
+
+Usage:
+    python -m benchmarks.bench_db
+    python -m benchmarks.bench_db --repeat 500
+
+Runs the same read-only operations with the legacy setup (a new sessionmaker on every
+access and an engine with echo=True) and with session_scope on the tuned engine,
+and prints p50/p95/max latency per operation in milliseconds.
+Needs a running db that has the tables created by create_table_unless_exists.
+"""
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import statistics
+import time
+from typing import Callable, ContextManager, Dict, List
+
+
+def measure(name: str, repeat: int, func: Callable[[], object]) -> None:
+    latencies: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(
+        f'{name:<28} n={repeat:>6} '
+        f'p50={statistics.median(latencies):8.3f}ms '
+        f'p95={latencies[int(len(latencies) * 0.95) - 1]:8.3f}ms '
+        f'max={latencies[-1]:8.3f}ms'
+    )
+
+
+def legacy_scope_factory() -> Callable[[], ContextManager]:
+    """Session handling before session_scope: sessionmaker per access and echo=True"""
+    import logging
+
+    from sqlalchemy.engine import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from utils.database import database_url
+
+    engine = create_engine(database_url(), encoding="utf-8", echo=True, executemany_mode='values')
+    # Keep the cost of formatting log records but do not flood the terminal
+    logging.getLogger('sqlalchemy.engine').handlers = [logging.NullHandler()]
+
+    @contextmanager
+    def legacy_scope():
+        session = sessionmaker(bind=engine)()
+        yield session
+        session.commit()
+        session.close()
+
+    return legacy_scope
+
+
+def operations() -> Dict[str, Callable]:
+    from sqlalchemy import text
+
+    from models.liked_tweets import count_likes_since
+    from models.users import fetch_existing_user_ids
+
+    ids = set(range(1, 101))
+    since = datetime.now() - timedelta(days=1)
+    return {
+        'select_1': lambda session: session.execute(text('SELECT 1')).scalar(),
+        'existence_check_100_ids': lambda session: fetch_existing_user_ids(session, ids),
+        'count_likes_since': lambda session: count_likes_since(session, since),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    from utils import session_scope
+
+    scopes = {
+        'legacy': legacy_scope_factory(),
+        'session_scope': session_scope,
+    }
+    for operation_name, operation in operations().items():
+        for scope_name, scope in scopes.items():
+
+            def run():
+                with scope() as session:
+                    operation(session)
+
+            run()  # warm up the pool
+            measure(f'{scope_name}:{operation_name}', args.repeat, run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark for LogicBase.filter_by_existence_in_database
+
+Usage:
+    python -m benchmarks.bench_existence_filter
+    python -m benchmarks.bench_existence_filter --sizes 10000 --with-db
+
+Prints ids/sec of the in-process index and, with --with-db, of chunked db lookups.
+"""
+import argparse
+import random
+import time
+from typing import Callable, List
+
+from utils.id_index import KnownIdIndex
+
+
+SIZES = [10000, 1000000, 5000000]
+
+
+def measure(name: str, size: int, func: Callable[[], object]) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<12} size={size:>9,} elapsed={elapsed:8.3f}s ids/sec={size / elapsed:>14,.0f}')
+
+
+def bench_index(ids: List[int], known_ratio: float) -> None:
+    known = ids[:int(len(ids) * known_ratio)]
+    index = KnownIdIndex()
+    measure('index_load', len(known), lambda: index.load(known))
+    measure('index_hit', len(ids), lambda: index.contains_many(ids))
+
+
+def bench_db(ids: List[int]) -> None:
+    from utils import session_scope
+    from models.users import fetch_existing_user_ids
+
+    with session_scope() as session:
+        measure('db_chunked', len(ids), lambda: fetch_existing_user_ids(session, ids))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--known-ratio', type=float, default=0.5)
+    parser.add_argument('--with-db', action='store_true')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        ids = random.sample(range(1, 2 ** 62), size)
+        bench_index(ids, args.known_ratio)
+        if args.with_db:
+            bench_db(ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark for IdSet against set[int] on follower ids
+
+Usage:
+    python -m benchmarks.bench_id_set
+    python -m benchmarks.bench_id_set --sizes 1000000 --targets 5
+
+Prints time and memory of the union of the followers of targets and the difference against known ids.
+"""
+import argparse
+import sys
+import time
+from typing import Callable, List, TypeVar
+
+import numpy as np
+
+from utils.id_set import IdSet
+
+
+SIZES = [100000, 1000000, 5000000]
+PAGE_SIZE = 5000
+
+T = TypeVar('T')
+
+
+def measure(name: str, size: int, func: Callable[[], T]) -> T:
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<18} size={size:>9,} elapsed={elapsed:8.3f}s')
+    return result
+
+
+def set_nbytes(ids: set) -> int:
+    return sys.getsizeof(ids) + sum(sys.getsizeof(id_) for id_ in ids)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--targets', type=int, default=3)
+    parser.add_argument('--known-ratio', type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        # Followers of targets overlap by drawing from a range twice as large as a target
+        pages: List[List[int]] = [
+            rng.integers(1, 2 * size, PAGE_SIZE, dtype=np.int64).tolist()
+            for _ in range(args.targets * size // PAGE_SIZE)
+        ]
+        known_ids = rng.integers(1, 2 * size, int(size * args.known_ratio), dtype=np.int64).tolist()
+
+        def union_set() -> set:
+            all_ids = set()
+            for page in pages:
+                all_ids.update(page)
+            return all_ids
+
+        all_set = measure('set_union', size, union_set)
+        all_id_set = measure('id_set_union', size, lambda: IdSet.union_all(pages))
+        known_set = set(known_ids)
+        known_id_set = IdSet(known_ids)
+        measure('set_difference', size, lambda: all_set - known_set)
+        measure('id_set_difference', size, lambda: all_id_set - known_id_set)
+        print(f'{"memory":<18} size={size:>9,} set={set_nbytes(all_set) / 2 ** 20:8.1f}MiB '
+              f'id_set={all_id_set.nbytes / 2 ** 20:8.1f}MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Import-time budget check
+
+Usage:
+    python -m benchmarks.bench_import_time
+    python -m benchmarks.bench_import_time --module main_bot --budget 0.5
+
+Runs python -X importtime in a fresh interpreter and exits with 1
+if the cumulative import time of the module exceeds the budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict
+
+from utils.settings import IMPORT_TIME_BUDGET_IN_SEC
+
+
+def measure_import_time(module: str) -> Dict[str, int]:
+    """Return cumulative import time in microseconds per imported module"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=os.environ.copy(),
+        universal_newlines=True,
+        check=True,
+    )
+    cumulative_times: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        cumulative_times[name.strip()] = int(cumulative)
+    return cumulative_times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='logics')
+    parser.add_argument('--budget', type=float, default=IMPORT_TIME_BUDGET_IN_SEC)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    cumulative_times = measure_import_time(args.module)
+    for name, us in sorted(cumulative_times.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'{us / 1e6:8.3f}s {name}')
+
+    elapsed = cumulative_times[args.module] / 1e6
+    print(f'import {args.module}: {elapsed:.3f}s (budget {args.budget:.3f}s)')
+    if elapsed > args.budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""End-to-end load test of UserLogic and LikeLogic against benchmarks.fake_twitter
+
+Usage:
+    python -m benchmarks.bench_load
+    python -m benchmarks.bench_load --targets 2 --followers 20000 --likes 50 --latency-ms 50
+    python -m benchmarks.bench_load --credentials 4 --output bench_load.jsonl
+
+Starts the fake API in a child process, points TwitterClient and slack to it
+and runs follower harvesting, likes of users in db and likes by keyword.
+Prints users evaluated/sec, likes/sec, API calls per saved user, 429s and peak RSS of the bot.
+Needs a running db. Rows written by the run stay in it, so use a disposable db.
+"""
+import argparse
+import asyncio
+from dataclasses import asdict
+import json
+from multiprocessing import Process
+import os
+import resource
+import socket
+import ssl
+import tempfile
+import time
+from typing import Any, Dict
+from urllib.request import urlopen
+
+from benchmarks.fake_twitter import FakeTwitterConfig, make_certificate, serve
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_twitter(config: FakeTwitterConfig, cert_dir: str, num_credentials: int = 1) -> Process:
+    """Serve the fake API in a child process and point the bot to it
+
+    Notes:
+        Environment variables are set before settings is imported, so this has to run
+        before anything of the bot is imported.
+        The server runs in another process so that peak RSS is of the bot only.
+    """
+    cert_file, key_file = make_certificate(cert_dir)
+    port = free_port()
+    process = Process(target=serve, args=(config, port, cert_file, key_file), daemon=True)
+    process.start()
+
+    os.environ['TWITTER_API_HOST'] = f'127.0.0.1:{port}'
+    os.environ['SLACK_API_URL'] = f'https://127.0.0.1:{port}/api/chat.postMessage'
+    os.environ['REQUESTS_CA_BUNDLE'] = cert_file
+    for name in ('CONSUMER_KEY', 'CONSUMER_SECRET', 'ACCESS_TOKEN', 'ACCESS_TOKEN_SECRET', 'SLACK_TOKEN'):
+        os.environ.setdefault(name, 'fake')
+    if num_credentials > 1:
+        credentials_file = os.path.join(cert_dir, 'extra_credentials.json')
+        with open(credentials_file, 'w') as f:
+            json.dump([
+                {
+                    'consumer_key': 'fake',
+                    'consumer_secret': 'fake',
+                    'access_token': f'fake_{idx}',
+                    'access_token_secret': 'fake',
+                }
+                for idx in range(num_credentials - 1)
+            ], f)
+        os.environ['TWITTER_EXTRA_CREDENTIALS_FILE'] = credentials_file
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.1):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('fake twitter did not start')
+
+
+def fetch_stats() -> Dict[str, Any]:
+    context = ssl.create_default_context(cafile=os.environ['REQUESTS_CA_BUNDLE'])
+    with urlopen(f"https://{os.environ['TWITTER_API_HOST']}/_stats", context=context) as res:
+        return json.loads(res.read())
+
+
+def count_saved_users() -> int:
+    from models import ValuableUsers
+    from utils import session_scope
+
+    with session_scope() as session:
+        return session.query(ValuableUsers).count()
+
+
+async def run_scenario(num_targets: int, num_db_likes: int, num_keyword_likes: int) -> Dict[str, float]:
+    """Run each pipeline once and return elapsed seconds per phase"""
+    from logics import LikeLogic, UserLogic
+    from logics.like_scheduler import LikeScheduler
+    from logics.search_planner import plan_searches
+    from models.search_watermarks import save_watermarks
+    from utils import TARGET_KEYWORD_AND_IMPORTANCE, session_scope
+
+    elapsed: Dict[str, float] = {}
+    run_id = int(time.time())
+
+    user_logic = UserLogic()
+    start = time.perf_counter()
+    for idx in range(num_targets):
+        await user_logic.harvest_followers(f'bench_{run_id}_{idx}')
+    elapsed['harvest'] = time.perf_counter() - start
+
+    like_logic = LikeLogic()
+    # The daily budget is not what is measured here
+    like_logic.like_scheduler = LikeScheduler(limit_per_day=10 ** 6, burst=10 ** 6)
+    start = time.perf_counter()
+    await like_logic.like_tweet_from_users_in_db(data_num=num_db_likes)
+    elapsed['like_db_users'] = time.perf_counter() - start
+
+    keywords = [keyword for keyword, _ in TARGET_KEYWORD_AND_IMPORTANCE]
+    start = time.perf_counter()
+    for plan in plan_searches(keywords):
+        tweets_by_keyword, watermarks = await like_logic.search_tweets_of_plan(plan)
+        for keyword in plan.keywords:
+            await like_logic.like_from_keyword(
+                keyword,
+                max(1, num_keyword_likes // len(keywords)),
+                tweets_by_keyword[keyword]
+            )
+        # Later runs against the same db search only the tweets after these
+        with session_scope() as session:
+            save_watermarks(session, watermarks)
+    elapsed['like_keyword'] = time.perf_counter() - start
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--targets', type=int, default=1)
+    parser.add_argument('--credentials', type=int, default=1, help='number of accounts including the primary one')
+    parser.add_argument('--followers', type=int, default=FakeTwitterConfig.num_followers)
+    parser.add_argument('--timeline-length', type=int, default=FakeTwitterConfig.timeline_length)
+    parser.add_argument('--likes', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=FakeTwitterConfig.latency_in_sec * 1000)
+    parser.add_argument('--window', type=int, default=FakeTwitterConfig.window_in_sec)
+    parser.add_argument('--throttle-ratio', type=float, default=FakeTwitterConfig.throttle_ratio)
+    parser.add_argument('--output', help='append the result as a json line to this file')
+    args = parser.parse_args()
+
+    config = FakeTwitterConfig(
+        num_followers=args.followers,
+        timeline_length=args.timeline_length,
+        latency_in_sec=args.latency_ms / 1000,
+        window_in_sec=args.window,
+        throttle_ratio=args.throttle_ratio,
+    )
+    with tempfile.TemporaryDirectory() as cert_dir:
+        server = start_fake_twitter(config, cert_dir, args.credentials)
+
+        from models.users import create_table_unless_exists
+        from clients.slack_client import NOTIFIER
+
+        create_table_unless_exists()
+        saved_before = count_saved_users()
+        elapsed = asyncio.get_event_loop().run_until_complete(
+            run_scenario(args.targets, args.likes, args.likes)
+        )
+        NOTIFIER.flush()
+        stats = fetch_stats()
+        saved_users = count_saved_users() - saved_before
+        server.terminate()
+
+    api_calls = sum(stats['calls'].values())
+    likes_elapsed = elapsed['like_db_users'] + elapsed['like_keyword']
+    result = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': asdict(config),
+        'targets': args.targets,
+        'credentials': args.credentials,
+        'elapsed_in_sec': elapsed,
+        'users_evaluated_per_sec': stats['profiles_served'] / elapsed['harvest'],
+        'likes_per_sec': stats['likes'] / likes_elapsed,
+        'saved_users': saved_users,
+        'api_calls': api_calls,
+        'api_calls_per_saved_user': api_calls / saved_users if saved_users else None,
+        'calls_by_endpoint': stats['calls'],
+        'throttled_by_endpoint': stats['throttled'],
+        # ru_maxrss is in kilobytes on linux
+        'peak_rss_in_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+    for key in ('users_evaluated_per_sec', 'likes_per_sec', 'api_calls_per_saved_user', 'peak_rss_in_mb'):
+        value = result[key]
+        print(f'{key:<26} {value:12.3f}' if value is not None else f'{key:<26} {"n/a":>12}')
+    print(f"{'saved_users':<26} {saved_users:12d}")
+    for endpoint, calls in sorted(stats['calls'].items()):
+        print(f'  {endpoint:<26} calls={calls:>7} 429={stats["throttled"].get(endpoint, 0):>5}')
+
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+"""Local stand-in for the v1.1 endpoints used by TwitterClient
+
+Usage:
+    python -m benchmarks.fake_twitter --port 8443 --followers 20000 --latency-ms 50
+
+Serves synthetic followers, profiles, timelines and search results over https,
+counts the quota of every endpoint family in windows of --window seconds and answers
+429 with x-rate-limit-* headers like twitter does. Slack posts are accepted as well,
+so the bot can run against it without any credential.
+GET /_stats returns the number of calls, 429s and likes per endpoint.
+"""
+import argparse
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import ssl
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from zlib import crc32
+
+
+# Same figures as RATE_LIMIT_DEFAULTS. Kept here so the server does not import settings.
+DEFAULT_LIMITS: Dict[str, int] = {
+    '/search/tweets': 180,
+    '/users/show/:id': 900,
+    '/users/lookup': 900,
+    '/statuses/user_timeline': 900,
+    '/followers/ids': 15,
+    '/favorites/create': 15,
+    '/favorites/list': 75,
+}
+FOLLOWERS_PER_PAGE = 5000
+
+
+@dataclass
+class FakeTwitterConfig:
+    """Sizes of the synthetic data and behaviour of the fake API
+
+    Notes:
+        window_in_sec is shorter than the real 15 minutes so that a benchmark
+        hits resets within seconds. latency_in_sec is added to every request with 20% jitter.
+    """
+    num_followers: int = 20000
+    timeline_length: int = 20
+    valuable_ratio: float = 0.3
+    likable_ratio: float = 0.7
+    latency_in_sec: float = 0.05
+    window_in_sec: int = 60
+    limits: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_LIMITS))
+    # Ratio of requests answered with 429 even if quota remains
+    throttle_ratio: float = 0.0
+    seed: int = 0
+
+
+def to_twitter_time(dt: datetime) -> str:
+    return dt.strftime('%a %b %d %H:%M:%S +0000 %Y')
+
+
+class FakeTwitterData:
+    """Deterministic synthetic data. The same id always yields the same profile and timeline."""
+
+    def __init__(self, config: FakeTwitterConfig):
+        self.config = config
+        self.liked: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._last_tweet_id = int(time.time() * 1000) << 22
+
+    def _rng(self, *keys) -> random.Random:
+        # A str seed is hashed with sha512, so it does not depend on PYTHONHASHSEED
+        return random.Random(':'.join(str(key) for key in (self.config.seed,) + keys))
+
+    def user(self, user_id: int) -> Dict[str, Any]:
+        rng = self._rng('user', user_id)
+        is_valuable = rng.random() < self.config.valuable_ratio
+        return {
+            'id': user_id,
+            'id_str': str(user_id),
+            'name': f'user {user_id}',
+            'screen_name': f'user_{user_id}',
+            'description': 'I write code and read papers every day.' if is_valuable else 'hi',
+            'followers_count': rng.randint(10, 5000) if is_valuable else rng.randint(0, 9),
+            'friends_count': rng.randint(10, 5000),
+            'favourites_count': rng.randint(10, 50000),
+            'statuses_count': rng.randint(1, 10000),
+            'protected': False,
+            'verified': rng.random() < 0.01,
+            'following': False,
+            'created_at': to_twitter_time(datetime(2015, 1, 1)),
+        }
+
+    def tweet(self, tweet_id: int, user: Dict[str, Any], text: str, created_at: datetime) -> Dict[str, Any]:
+        rng = self._rng('tweet', tweet_id)
+        is_likable = rng.random() < self.config.likable_ratio
+        return {
+            'id': tweet_id,
+            'id_str': str(tweet_id),
+            'text': text[:140],
+            'full_text': text,
+            'created_at': to_twitter_time(created_at),
+            'favorite_count': rng.randint(0, 10) if is_likable else rng.randint(11, 1000),
+            'retweet_count': rng.randint(0, 10),
+            'favorited': tweet_id in self.liked,
+            'retweeted': False,
+            'lang': 'ja',
+            'user': user,
+        }
+
+    def timeline(self, user_id: int, count: int) -> List[Dict[str, Any]]:
+        rng = self._rng('timeline', user_id)
+        user = self.user(user_id)
+        is_active = rng.random() < 0.8
+        created_at = datetime.utcnow() - timedelta(days=rng.randint(0, 5) if is_active else rng.randint(60, 400))
+        tweets = []
+        for idx in range(min(count, self.config.timeline_length)):
+            tweet_id = (user_id % (1 << 40)) * 1000 + self.config.timeline_length - idx
+            tweets.append(self.tweet(tweet_id, user, f'tweet {idx} of {user_id}', created_at))
+            created_at -= timedelta(hours=rng.randint(1, 48))
+        return tweets
+
+    def follower_ids(self, target: str, cursor: int) -> Tuple[List[int], int]:
+        start = max(cursor, 0)
+        end = min(start + FOLLOWERS_PER_PAGE, self.config.num_followers)
+        base = (crc32(target.encode()) & 0xffffff) << 32
+        ids = [base + idx + 1 for idx in range(start, end)]
+        return ids, end if end < self.config.num_followers else 0
+
+    def search(self, query: str, count: int, since_id: Optional[int], max_id: Optional[int]) -> List[Dict[str, Any]]:
+        keywords = [keyword.strip('"') for keyword in query.split(' OR ')]
+        with self._lock:
+            # New tweets keep arriving between searches
+            self._last_tweet_id += count * 1000
+            newest = self._last_tweet_id
+        tweet_id = min(newest, max_id) if max_id is not None else newest
+        rng = self._rng('search', tweet_id)
+        tweets = []
+        while len(tweets) < count:
+            tweet_id -= rng.randint(1, 1000)
+            if since_id is not None and tweet_id <= since_id:
+                break
+            user = self.user(rng.randint(1, 1 << 40))
+            keyword = rng.choice(keywords)
+            tweets.append(self.tweet(tweet_id, user, f'{keyword} について', datetime.utcnow()))
+        return tweets
+
+    def like(self, tweet_id: int) -> Optional[Dict[str, Any]]:
+        """Return the liked tweet or None if it has already been liked"""
+        with self._lock:
+            if tweet_id in self.liked:
+                return None
+            tweet = self.tweet(tweet_id, self.user(tweet_id % (1 << 40)), f'tweet {tweet_id}', datetime.utcnow())
+            tweet['favorited'] = True
+            self.liked[tweet_id] = tweet
+            return tweet
+
+    def favorites(self, count: int, max_id: Optional[int]) -> List[Dict[str, Any]]:
+        with self._lock:
+            ids = sorted(self.liked, reverse=True)
+        ids = [id_ for id_ in ids if max_id is None or id_ <= max_id][:count]
+        return [self.liked[id_] for id_ in ids]
+
+
+class RateLimitWindows:
+    """Quota of every account and endpoint family counted like twitter does"""
+
+    def __init__(self, limits: Dict[str, int], window_in_sec: int):
+        self._limits = limits
+        self._window_in_sec = window_in_sec
+        self._windows: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, account: str, endpoint: str) -> Tuple[bool, Dict[str, str]]:
+        """Count a request of account and return (allowed, x-rate-limit-* headers)"""
+        now = int(time.time())
+        limit = self._limits.get(endpoint, 15)
+        with self._lock:
+            remaining, reset = self._windows.get((account, endpoint), (limit, now + self._window_in_sec))
+            if now >= reset:
+                remaining, reset = limit, now + self._window_in_sec
+            allowed = remaining > 0
+            if allowed:
+                remaining -= 1
+            self._windows[(account, endpoint)] = (remaining, reset)
+        return allowed, {
+            'x-rate-limit-limit': str(limit),
+            'x-rate-limit-remaining': str(remaining),
+            'x-rate-limit-reset': str(reset),
+        }
+
+
+class FakeTwitterStats:
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.throttled: Dict[str, int] = {}
+        self.profiles_served = 0
+        self.likes = 0
+        self._lock = threading.Lock()
+
+    def count(self, endpoint: str, is_throttled: bool, num_profiles: int = 0, num_likes: int = 0) -> None:
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            if is_throttled:
+                self.throttled[endpoint] = self.throttled.get(endpoint, 0) + 1
+            self.profiles_served += num_profiles
+            self.likes += num_likes
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'calls': dict(self.calls),
+                'throttled': dict(self.throttled),
+                'profiles_served': self.profiles_served,
+                'likes': self.likes,
+            }
+
+
+def make_handler(config: FakeTwitterConfig):
+    data = FakeTwitterData(config)
+    windows = RateLimitWindows(config.limits, config.window_in_sec)
+    stats = FakeTwitterStats()
+    rng = random.Random(config.seed)
+
+    class FakeTwitterHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _params(self) -> Dict[str, str]:
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                body = self.rfile.read(length).decode()
+                params.update({k: v[-1] for k, v in parse_qs(body).items()})
+            return params
+
+        def _account(self) -> str:
+            """oauth_token of the Authorization header. Each access token has its own quota."""
+            authorization = self.headers.get('Authorization', '')
+            for item in authorization.replace('OAuth ', '', 1).split(','):
+                key, _, value = item.strip().partition('=')
+                if key == 'oauth_token':
+                    return value.strip('"')
+            return ''
+
+        def _send(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json;charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.send_header('Date', format_datetime(datetime.utcnow()))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _handle(self) -> None:
+            path = urlparse(self.path).path
+            params = self._params()
+            if path == '/_stats':
+                return self._send(200, stats.to_dict())
+            if path == '/api/chat.postMessage':
+                return self._send(200, {'ok': True})
+
+            route = ROUTES.get(path.replace('/1.1', '', 1))
+            if route is None:
+                return self._send(404, {'errors': [{'code': 34, 'message': 'Sorry, that page does not exist.'}]})
+            endpoint, func = route
+
+            time.sleep(max(0.0, rng.gauss(config.latency_in_sec, config.latency_in_sec * 0.2)))
+            allowed, headers = windows.take(self._account(), endpoint)
+            if not allowed or rng.random() < config.throttle_ratio:
+                stats.count(endpoint, is_throttled=True)
+                return self._send(429, {'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}, headers)
+            status, body, num_profiles, num_likes = func(params)
+            stats.count(endpoint, is_throttled=False, num_profiles=num_profiles, num_likes=num_likes)
+            self._send(status, body, headers)
+
+        do_GET = _handle
+        do_POST = _handle
+
+    def search(params):
+        tweets = data.search(
+            params.get('q', ''),
+            int(params.get('count', 15)),
+            int(params['since_id']) if 'since_id' in params else None,
+            int(params['max_id']) if 'max_id' in params else None,
+        )
+        return 200, {'statuses': tweets, 'search_metadata': {'count': len(tweets)}}, 0, 0
+
+    def users_show(params):
+        return 200, data.user(int(params['id'])), 1, 0
+
+    def users_lookup(params):
+        users = [data.user(int(id_)) for id_ in params.get('user_id', '').split(',') if id_]
+        return 200, users, len(users), 0
+
+    def user_timeline(params):
+        return 200, data.timeline(int(params['id']), int(params.get('count', 20))), 0, 0
+
+    def followers_ids(params):
+        ids, next_cursor = data.follower_ids(params['id'], int(params.get('cursor', -1)))
+        return 200, {'ids': ids, 'previous_cursor': 0, 'next_cursor': next_cursor}, 0, 0
+
+    def favorites_create(params):
+        tweet = data.like(int(params['id']))
+        if tweet is None:
+            return 403, {'errors': [{'code': 139, 'message': 'You have already favorited this status.'}]}, 0, 0
+        return 200, tweet, 0, 1
+
+    def favorites_list(params):
+        max_id = int(params['max_id']) if 'max_id' in params else None
+        return 200, data.favorites(int(params.get('count', 20)), max_id), 0, 0
+
+    ROUTES: Dict[str, Tuple[str, Callable]] = {
+        '/search/tweets.json': ('/search/tweets', search),
+        '/users/show.json': ('/users/show/:id', users_show),
+        '/users/lookup.json': ('/users/lookup', users_lookup),
+        '/statuses/user_timeline.json': ('/statuses/user_timeline', user_timeline),
+        '/followers/ids.json': ('/followers/ids', followers_ids),
+        '/favorites/create.json': ('/favorites/create', favorites_create),
+        '/favorites/list.json': ('/favorites/list', favorites_list),
+    }
+    return FakeTwitterHandler
+
+
+OPENSSL_CONFIG = """[req]
+prompt = no
+distinguished_name = dn
+x509_extensions = san
+
+[dn]
+CN = localhost
+
+[san]
+subjectAltName = IP:127.0.0.1,DNS:localhost
+"""
+
+
+def make_certificate(directory: str) -> Tuple[str, str]:
+    """Create a self-signed certificate for 127.0.0.1
+
+    Returns:
+        (cert_file, key_file). Set REQUESTS_CA_BUNDLE to cert_file so that requests trusts it.
+
+    Notes:
+        tweepy always sends requests over https, so the fake server has to speak TLS.
+        The subjectAltName is given by a config file because -addext needs OpenSSL 1.1.1,
+        and the image(debian stretch) has 1.1.0.
+    """
+    cert_file = os.path.join(directory, 'fake_twitter.crt')
+    key_file = os.path.join(directory, 'fake_twitter.key')
+    config_file = os.path.join(directory, 'fake_twitter.cnf')
+    with open(config_file, 'w') as f:
+        f.write(OPENSSL_CONFIG)
+    subprocess.run(
+        [
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+            '-keyout', key_file, '-out', cert_file, '-config', config_file,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return cert_file, key_file
+
+
+def serve(config: FakeTwitterConfig, port: int, cert_file: str, key_file: str) -> None:
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(config))
+    server.daemon_threads = True
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--followers', type=int, default=FakeTwitterConfig.num_followers)
+    parser.add_argument('--latency-ms', type=float, default=FakeTwitterConfig.latency_in_sec * 1000)
+    parser.add_argument('--window', type=int, default=FakeTwitterConfig.window_in_sec)
+    parser.add_argument('--throttle-ratio', type=float, default=FakeTwitterConfig.throttle_ratio)
+    parser.add_argument('--cert-dir', default='.')
+    args = parser.parse_args()
+
+    config = FakeTwitterConfig(
+        num_followers=args.followers,
+        latency_in_sec=args.latency_ms / 1000,
+        window_in_sec=args.window,
+        throttle_ratio=args.throttle_ratio,
+    )
+    cert_file, key_file = make_certificate(args.cert_dir)
+    print(f'Serving on https://127.0.0.1:{args.port} with {json.dumps(asdict(config))}')
+    print(f'export REQUESTS_CA_BUNDLE={os.path.abspath(cert_file)} TWITTER_API_HOST=127.0.0.1:{args.port}')
+    serve(config, args.port, cert_file, key_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,16 @@ from .slack_client import (
     SLACK_ERROR,
 )
 from .twitter_client import TwitterClient
+from .async_twitter_client import AsyncTwitterClient
+from .ledger import LIKED_TWEETS
+from .rate_limit import RATE_LIMITS
 
 __all__ = [
     'SLACK_INFO',
     'SLACK_WARNING',
     'SLACK_ERROR',
-    'TwitterClient'
+    'TwitterClient',
+    'AsyncTwitterClient',
+    'LIKED_TWEETS',
+    'RATE_LIMITS',
 ]
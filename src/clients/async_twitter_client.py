@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, List, Optional, Tuple
+
+from tweepy import models
+
+from .rate_limit import RATE_LIMITS, EndpointThrottled
+from .twitter_client import TwitterClient
+from utils import TWITTER_MAX_WORKERS
+
+
+class AsyncTwitterClient:
+    """Awaitable version of TwitterClient
+
+    Notes:
+        Blocking tweepy calls are offloaded to a bounded thread pool,
+        so up to max_workers requests can be in flight while the event loop keeps running.
+        Rate limits are still guarded by the decorators of TwitterClient.
+        A call on a throttled endpoint releases its thread and awaits the reset on the event loop,
+        so calls on other endpoints keep flowing. Calls that send many requests in a row
+        (backfill_liked_tweets) wait in their thread instead,
+        because retrying them from the start would repeat the pages already fetched.
+    """
+
+    def __init__(self, client: Optional[TwitterClient] = None, max_workers: int = TWITTER_MAX_WORKERS):
+        self.client = client if client is not None else TwitterClient()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def _run(self, func, **kwargs):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                return await loop.run_in_executor(self._executor, partial(self._call_non_blocking, func, **kwargs))
+            except EndpointThrottled as e:
+                await RATE_LIMITS.wait_async(e.endpoint, e.credentials)
+
+    async def _run_blocking(self, func, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, partial(func, **kwargs))
+
+    @staticmethod
+    def _call_non_blocking(func, **kwargs):
+        with RATE_LIMITS.non_blocking():
+            return func(**kwargs)
+
+    async def fetch_tweets_by_keyword(self, **kwargs):
+        return await self._run(self.client.fetch_tweets_by_keyword, **kwargs)
+
+    async def like_tweet(self, **kwargs):
+        return await self._run(self.client.like_tweet, **kwargs)
+
+    async def backfill_liked_tweets(self) -> int:
+        return await self._run_blocking(self.client.backfill_liked_tweets)
+
+    async def fetch_user_info(self, **kwargs) -> Optional[models.User]:
+        return await self._run(self.client.fetch_user_info, **kwargs)
+
+    async def fetch_users_info(self, user_ids: List[int]) -> List[models.User]:
+        return await self._run(self.client.fetch_users_info, user_ids=user_ids)
+
+    async def fetch_user_tweet(self, **kwargs):
+        return await self._run(self.client.fetch_user_tweet, **kwargs)
+
+    async def fetch_user_follower_ids_page(self, user_id: str, cursor: int = -1) -> Tuple[List[int], int]:
+        return await self._run(self.client.fetch_user_follower_ids_page, user_id=user_id, cursor=cursor)
+
+    async def iter_user_follower_id_pages(
+            self,
+            user_id: str,
+            cursor: int = -1
+    ) -> AsyncIterator[Tuple[List[int], int]]:
+        """Yield (ids, next_cursor) page by page without keeping previous pages"""
+        while cursor != 0:
+            ids, cursor = await self.fetch_user_follower_ids_page(user_id, cursor)
+            yield ids, cursor
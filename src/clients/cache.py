@@ -0,0 +1,160 @@
+from collections import OrderedDict
+import os
+import shelve
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+from utils.metrics import register_stats
+from utils import (
+    CACHE_TTL_IN_SEC,
+    CACHE_MAX_SIZE,
+    CACHE_DISK_DIR,
+)
+
+
+class DiskCacheTier:
+    """Second tier of TTLCache that survives restarts
+
+    Notes:
+        Entries are pickled into a shelve file with their expiry. tweepy models drop their api when pickled.
+        Expired entries are removed on open and once per max_size writes. If more than max_size
+        entries are left, the ones that expire first are removed.
+    """
+
+    def __init__(self, path: str, max_size: int):
+        self._shelf = shelve.open(path)
+        self._max_size = max_size
+        self._num_sets_since_prune = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self._prune()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            entry = self._shelf.get(key)
+            if entry is not None and entry[0] <= time.time():
+                del self._shelf[key]
+                return None
+            return entry
+
+    def set(self, key: str, expires_at: float, value: Any) -> None:
+        with self._lock:
+            self._shelf[key] = (expires_at, value)
+            self._num_sets_since_prune += 1
+            if self._num_sets_since_prune >= self._max_size:
+                self._prune()
+
+    def _prune(self) -> None:
+        now = time.time()
+        expires_at_by_key: Dict[str, float] = {key: self._shelf[key][0] for key in self._shelf.keys()}
+        keys_by_expiry = sorted(expires_at_by_key, key=expires_at_by_key.get)
+        num_expired = sum(1 for key in keys_by_expiry if expires_at_by_key[key] <= now)
+        for key in keys_by_expiry[:max(num_expired, len(keys_by_expiry) - self._max_size)]:
+            del self._shelf[key]
+        self._num_sets_since_prune = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._shelf.close()
+
+
+class TTLCache:
+    """Size bounded LRU cache whose entries expire after ttl_in_sec"""
+
+    def __init__(
+            self,
+            ttl_in_sec: float,
+            max_size: int,
+            disk_tier: Optional[DiskCacheTier] = None
+    ):
+        self.ttl_in_sec = ttl_in_sec
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._disk_tier = disk_tier
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (True, value) on hit and (False, None) on miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+
+        entry = self._disk_tier.get(key) if self._disk_tier is not None else None
+        with self._lock:
+            if entry is not None and entry[0] > now:
+                self._put(key, entry)
+                self.hits += 1
+                return True, entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return False, None
+
+    def set(self, key: str, value: Any) -> None:
+        entry = (time.time() + self.ttl_in_sec, value)
+        with self._lock:
+            self._put(key, entry)
+        if self._disk_tier is not None:
+            self._disk_tier.set(key, *entry)
+
+    def _put(self, key: str, entry: Tuple[float, Any]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            num_lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / num_lookups if num_lookups else 0.0,
+                'size': len(self._entries),
+            }
+
+
+class CacheRegistry:
+    """Response caches keyed by endpoint family"""
+
+    def __init__(
+            self,
+            ttl_in_sec: Dict[str, float],
+            max_size: int,
+            disk_dir: Optional[str] = None
+    ):
+        self._ttl_in_sec = ttl_in_sec
+        self._max_size = max_size
+        self._disk_dir = disk_dir
+        self._caches: Dict[str, TTLCache] = {}
+        self._lock = threading.Lock()
+
+    def cache(self, endpoint: str) -> TTLCache:
+        with self._lock:
+            if endpoint not in self._caches:
+                disk_tier = None
+                if self._disk_dir is not None:
+                    os.makedirs(self._disk_dir, exist_ok=True)
+                    file_name = endpoint.strip('/').replace('/', '_').replace(':', '')
+                    disk_tier = DiskCacheTier(os.path.join(self._disk_dir, file_name), self._max_size)
+                self._caches[endpoint] = TTLCache(
+                    self._ttl_in_sec.get(endpoint, 0),
+                    self._max_size,
+                    disk_tier
+                )
+            return self._caches[endpoint]
+
+    def stats(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        with self._lock:
+            caches = dict(self._caches)
+        return {endpoint: cache.stats() for endpoint, cache in caches.items()}
+
+
+CACHES = CacheRegistry(CACHE_TTL_IN_SEC, CACHE_MAX_SIZE, CACHE_DISK_DIR)
+register_stats('twitter_cache', CACHES.stats)
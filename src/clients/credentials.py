@@ -0,0 +1,71 @@
+import json
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .rate_limit import PRIMARY_CREDENTIAL, READ_ENDPOINTS
+from utils import (
+    CONSUMER_KEY,
+    CONSUMER_SECRET,
+    ACCESS_TOKEN,
+    ACCESS_TOKEN_SECRET,
+    TWITTER_EXTRA_CREDENTIALS_FILE,
+)
+
+
+class Credential(NamedTuple):
+    """Keys and tokens of an account"""
+    name: str
+    consumer_key: str
+    consumer_secret: str
+    access_token: str
+    access_token_secret: str
+
+
+class CredentialPool:
+    """Credentials that requests can be sent with
+
+    Notes:
+        The primary credential is the account that the bot likes with.
+        Requests of READ_ENDPOINTS can be sent with any credential, so their quota grows
+        with the number of credentials. Other requests are pinned to the primary credential.
+    """
+
+    def __init__(self, credentials: List[Credential]):
+        self._credentials: Dict[str, Credential] = {credential.name: credential for credential in credentials}
+        self._all_names: Tuple[str, ...] = tuple(self._credentials)
+        self._primary_names: Tuple[str, ...] = (PRIMARY_CREDENTIAL,)
+
+    def __len__(self) -> int:
+        return len(self._credentials)
+
+    def get(self, name: str) -> Credential:
+        return self._credentials[name]
+
+    def names_for(self, endpoint: str) -> Tuple[str, ...]:
+        """Names of the credentials that may send a request of endpoint"""
+        return self._all_names if endpoint in READ_ENDPOINTS else self._primary_names
+
+    @classmethod
+    def from_settings(cls, extra_credentials_file: Optional[str] = TWITTER_EXTRA_CREDENTIALS_FILE) -> 'CredentialPool':
+        """Pool of the primary credential in settings and the credentials in extra_credentials_file
+
+        Args:
+            extra_credentials_file: json file of a list of objects whose keys are
+                consumer_key, consumer_secret, access_token and access_token_secret. None means no extras.
+        """
+        credentials = [
+            Credential(PRIMARY_CREDENTIAL, CONSUMER_KEY, CONSUMER_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
+        ]
+        if extra_credentials_file is not None:
+            with open(extra_credentials_file) as f:
+                for idx, keys in enumerate(json.load(f)):
+                    credentials.append(Credential(
+                        f'extra_{idx}',
+                        keys['consumer_key'],
+                        keys['consumer_secret'],
+                        keys['access_token'],
+                        keys['access_token_secret'],
+                    ))
+        return cls(credentials)
+
+
+CREDENTIALS = CredentialPool.from_settings()
@@ -0,0 +1,54 @@
+from datetime import datetime
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from models.liked_tweets import fetch_liked_tweet_ids, record_liked_tweets
+from utils import session_scope
+
+
+class LikedTweetLedger:
+    """Tweets liked by this account, persisted in liked_tweets
+
+    Notes:
+        Every id is also kept in a set, so checking a tweet before create_favorite costs no query.
+        The set is loaded from db on first use.
+    """
+
+    def __init__(self):
+        self._ids: Set[int] = set()
+        self._is_loaded = False
+        self._lock = threading.Lock()
+
+    def _load_unless_loaded(self) -> None:
+        with self._lock:
+            if self._is_loaded:
+                return
+            with session_scope() as session:
+                self._ids.update(fetch_liked_tweet_ids(session))
+            self._is_loaded = True
+
+    def __contains__(self, tweet_id: int) -> bool:
+        self._load_unless_loaded()
+        return tweet_id in self._ids
+
+    def __len__(self) -> int:
+        self._load_unless_loaded()
+        return len(self._ids)
+
+    def record(self, tweet_id: int, user_id: Optional[int] = None, liked_at: Optional[datetime] = None) -> None:
+        self.record_many([{'tweet_id': tweet_id, 'user_id': user_id, 'liked_at': liked_at}])
+
+    def record_many(self, rows: List[Dict[str, Any]]) -> None:
+        """Save liked tweets
+
+        Args:
+            rows: dicts whose keys are tweet_id, user_id and liked_at
+        """
+        self._load_unless_loaded()
+        with session_scope() as session:
+            record_liked_tweets(session, rows)
+        with self._lock:
+            self._ids.update(row['tweet_id'] for row in rows)
+
+
+LIKED_TWEETS = LikedTweetLedger()
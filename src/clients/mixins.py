@@ -1,11 +1,12 @@
+from contextlib import contextmanager
+import threading
+from typing import Dict
+
 import tweepy
 
 from utils import (
-    CONSUMER_KEY,
-    CONSUMER_SECRET,
-    ACCESS_TOKEN,
-    ACCESS_TOKEN_SECRET,
-    SLACK_TOKEN
+    SLACK_TOKEN,
+    TWITTER_API_HOST,
 )
 
 
@@ -16,15 +17,54 @@ class CredentialMixinBase:
 
 class TwitterCredentialMixin(CredentialMixinBase):
 
-    def __init__(self):
-        __auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
-        __auth.set_access_token(ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
-        self.__api = tweepy.API(__auth)
+    def __init__(self, credentials=None):
+        # Imported here because credentials depends on slack_client through rate_limit
+        from .credentials import CREDENTIALS, PRIMARY_CREDENTIAL
+
+        self.credentials = credentials if credentials is not None else CREDENTIALS
+        self._primary_credential = PRIMARY_CREDENTIAL
+        self.__local = threading.local()
+
+    @property
+    def current_credential(self) -> str:
+        """Name of the credential that api of the current thread sends requests with"""
+        return getattr(self.__local, 'credential', self._primary_credential)
+
+    def switch_credential(self, name: str) -> None:
+        """Send the following requests of the current thread with the credential of name"""
+        self.__local.credential = name
+
+    @contextmanager
+    def use_credential(self, name: str):
+        """Send requests of the current thread with the credential of name inside the block"""
+        previous = self.current_credential
+        self.switch_credential(name)
+        try:
+            yield
+        finally:
+            self.switch_credential(previous)
 
     # TODO: api should not belong to credential
     @property
     def api(self):
-        return self.__api
+        """tweepy.API of the current thread and the current credential
+
+        Notes:
+            api.last_response is overwritten by every request,
+            so each thread has its own api to read the headers of its own response.
+        """
+        apis: Dict[str, tweepy.API] = getattr(self.__local, 'apis', None)
+        if apis is None:
+            apis = self.__local.apis = {}
+        name = self.current_credential
+        api = apis.get(name)
+        if api is None:
+            credential = self.credentials.get(name)
+            __auth = tweepy.OAuthHandler(credential.consumer_key, credential.consumer_secret)
+            __auth.set_access_token(credential.access_token, credential.access_token_secret)
+            api = tweepy.API(__auth, host=TWITTER_API_HOST, search_host=TWITTER_API_HOST)
+            apis[name] = api
+        return api
 
 
 class SlackCredentialMixin(CredentialMixinBase):
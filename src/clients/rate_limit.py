@@ -0,0 +1,289 @@
+import asyncio
+from contextlib import contextmanager
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+from .slack_client import (
+    SLACK_WARNING,
+)
+from utils.metrics import register_stats
+from utils import (
+    RATE_LIMIT_DEFAULTS,
+    REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND,
+)
+
+
+# Endpoint families. Each of them has its own quota per window.
+SEARCH_TWEETS = '/search/tweets'
+USERS_SHOW = '/users/show/:id'
+USERS_LOOKUP = '/users/lookup'
+STATUSES_USER_TIMELINE = '/statuses/user_timeline'
+FOLLOWERS_IDS = '/followers/ids'
+FAVORITES_CREATE = '/favorites/create'
+FAVORITES_LIST = '/favorites/list'
+# Endpoint families that return the same data to any account, so any credential can send them.
+# Users and tweets carry following, favorited and retweeted of the account that sent the request,
+# which is_friend and evaluate_tweets rely on, so endpoints returning them stay on the primary credential.
+READ_ENDPOINTS = frozenset([
+    FOLLOWERS_IDS,
+])
+# Name of the credential of the account that the bot likes with
+PRIMARY_CREDENTIAL = 'primary'
+
+
+class EndpointThrottled(Exception):
+    """Raised instead of sleeping when a permit is not available in non_blocking mode"""
+
+    def __init__(self, endpoint: str, wait_in_sec: float, credentials: Tuple[str, ...] = (PRIMARY_CREDENTIAL,)):
+        super().__init__(f'{endpoint} is throttled for {int(wait_in_sec)} seconds')
+        self.endpoint = endpoint
+        self.wait_in_sec = wait_in_sec
+        self.credentials = credentials
+
+
+class TokenBucket:
+    """Permits of one endpoint family in the current rate limit window
+
+    Notes:
+        The bucket is refilled to limit when the window resets.
+        remaining and reset_at are corrected by x-rate-limit-* headers of every response,
+        so the bucket follows the quota that twitter actually counts, including requests of other processes.
+    """
+
+    def __init__(self, limit: int, window_in_sec: int):
+        self.limit = limit
+        self.window_in_sec = window_in_sec
+        self.remaining = limit
+        self.reset_at = time.time() + window_in_sec
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a permit
+
+        Returns:
+            0 if a permit was taken, otherwise seconds to wait until the window resets
+        """
+        with self._lock:
+            now = time.time()
+            if now >= self.reset_at:
+                self.remaining = self.limit
+                self.reset_at = now + self.window_in_sec
+            if self.remaining > 0:
+                self.remaining -= 1
+                return 0.0
+            return self.reset_at - now
+
+    def wait_time(self) -> float:
+        """Seconds until a permit is available without taking it"""
+        with self._lock:
+            now = time.time()
+            if now >= self.reset_at or self.remaining > 0:
+                return 0.0
+            return self.reset_at - now
+
+    def update(self, limit: Optional[int], remaining: int, reset_at: float) -> None:
+        with self._lock:
+            if limit is not None:
+                self.limit = limit
+            if reset_at > self.reset_at:
+                self.remaining = remaining
+            else:
+                # Same window. Permits handed out to requests in flight are not in the header yet.
+                self.remaining = min(self.remaining, remaining)
+            self.reset_at = reset_at
+
+    def exhaust(self, reset_at: Optional[float] = None) -> None:
+        with self._lock:
+            self.remaining = 0
+            self.reset_at = reset_at if reset_at is not None else time.time() + self.window_in_sec
+
+
+class RateLimitRegistry:
+    """Token buckets of every credential and endpoint family shared by every client in the process
+
+    Notes:
+        Each credential has its own quota per endpoint family, so buckets are keyed by both.
+        acquire takes a permit from whichever of the given credentials has the most remaining
+        and only callers of an endpoint whose credentials are all throttled wait for the earliest reset.
+        Threads in non_blocking mode get EndpointThrottled instead of sleeping,
+        so that the event loop awaits the reset and the worker thread is released for other endpoints.
+        stats() shows the quota per credential and throttle_stats() the time spent waiting per endpoint.
+    """
+
+    def __init__(
+            self,
+            defaults: Dict[str, int],
+            window_in_sec: int = REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND
+    ):
+        self._defaults = defaults
+        self._window_in_sec = window_in_sec
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._throttled_until: Dict[str, float] = {}
+        self._throttled_seconds: Dict[str, float] = {}
+        self._waiters: Dict[str, int] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def bucket(self, endpoint: str, credential: str = PRIMARY_CREDENTIAL) -> TokenBucket:
+        with self._lock:
+            key = (credential, endpoint)
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(
+                    self._defaults.get(endpoint, 15),
+                    self._window_in_sec
+                )
+            return self._buckets[key]
+
+    def acquire(self, endpoint: str, credentials: Sequence[str] = (PRIMARY_CREDENTIAL,)) -> str:
+        """Block until a permit of endpoint is available for one of credentials and take it
+
+        Args:
+            endpoint: endpoint family
+            credentials: names of credentials that may send the request
+
+        Returns:
+            name of the credential whose permit was taken
+
+        Raises:
+            EndpointThrottled: if no permit is available in non_blocking mode
+        """
+        while True:
+            buckets = sorted(
+                ((credential, self.bucket(endpoint, credential)) for credential in credentials),
+                key=lambda item: -item[1].remaining
+            )
+            wait_in_sec = float('inf')
+            for credential, bucket in buckets:
+                wait_in_sec = min(wait_in_sec, bucket.reserve())
+                if wait_in_sec <= 0:
+                    return credential
+            self._mark_throttled(endpoint, wait_in_sec)
+            if getattr(self._local, 'non_blocking', False):
+                raise EndpointThrottled(endpoint, wait_in_sec, tuple(credentials))
+            with self._waiting(endpoint):
+                time.sleep(wait_in_sec)
+
+    async def wait_async(self, endpoint: str, credentials: Sequence[str] = (PRIMARY_CREDENTIAL,)) -> None:
+        """Await until a permit of endpoint is available for one of credentials without taking it"""
+        while True:
+            wait_in_sec = self.wait_time(endpoint, credentials)
+            if wait_in_sec <= 0:
+                return
+            with self._waiting(endpoint):
+                await asyncio.sleep(wait_in_sec)
+
+    @contextmanager
+    def non_blocking(self):
+        """Make acquire in the current thread raise EndpointThrottled instead of sleeping"""
+        self._local.non_blocking = True
+        try:
+            yield
+        finally:
+            self._local.non_blocking = False
+
+    def wait_time(self, endpoint: str, credentials: Sequence[str] = (PRIMARY_CREDENTIAL,)) -> float:
+        """Seconds until a permit of endpoint is available for one of credentials"""
+        return min(self.bucket(endpoint, credential).wait_time() for credential in credentials)
+
+    def _mark_throttled(self, endpoint: str, wait_in_sec: float) -> None:
+        """Notify once per window that endpoint has run out of permits"""
+        throttled_until = time.time() + wait_in_sec
+        with self._lock:
+            is_new = throttled_until > self._throttled_until.get(endpoint, 0) + 1
+            self._throttled_until[endpoint] = throttled_until
+        if is_new:
+            SLACK_WARNING.send_message(
+                f"Too many requests for {endpoint}. It is suspended for {int(wait_in_sec)} seconds."
+            )
+
+    @contextmanager
+    def _waiting(self, endpoint: str):
+        started_at = time.time()
+        with self._lock:
+            self._waiters[endpoint] = self._waiters.get(endpoint, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._waiters[endpoint] -= 1
+                self._throttled_seconds[endpoint] = (
+                    self._throttled_seconds.get(endpoint, 0) + time.time() - started_at
+                )
+
+    def stats(self) -> Dict[Tuple[str, str], Dict[str, Union[int, float, bool]]]:
+        """Quota of every credential and endpoint family used so far
+
+        Returns:
+            limit, remaining, reset_in_sec and is_throttled per (credential, endpoint)
+        """
+        with self._lock:
+            buckets = dict(self._buckets)
+        now = time.time()
+        return {
+            key: {
+                'limit': bucket.limit,
+                'remaining': bucket.remaining,
+                'reset_in_sec': max(0.0, bucket.reset_at - now),
+                'is_throttled': bucket.wait_time() > 0,
+            }
+            for key, bucket in buckets.items()
+        }
+
+    def throttle_stats(self) -> Dict[str, Dict[str, Union[int, float, bool]]]:
+        """Waiting callers per endpoint family
+
+        Returns:
+            is_throttled(the last acquire found no permit on any credential and the reset has not come),
+            waiters and throttled_seconds(total time callers have spent waiting) per endpoint
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                endpoint: {
+                    'is_throttled': throttled_until > now,
+                    'waiters': self._waiters.get(endpoint, 0),
+                    'throttled_seconds': self._throttled_seconds.get(endpoint, 0.0),
+                }
+                for endpoint, throttled_until in self._throttled_until.items()
+            }
+
+    def update_from_response(self, endpoint: str, response, credential: str = PRIMARY_CREDENTIAL) -> None:
+        """Sync the bucket with x-rate-limit-* headers
+
+        Args:
+            endpoint: endpoint family of the request
+            response: requests.Response of the request. None is ignored.
+            credential: name of the credential that sent the request
+        """
+        if response is None:
+            return
+        headers = response.headers
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        if remaining is None or reset is None:
+            return
+        limit = headers.get('x-rate-limit-limit')
+        self.bucket(endpoint, credential).update(
+            int(limit) if limit is not None else None,
+            int(remaining),
+            float(reset)
+        )
+
+    def exhaust(self, endpoint: str, response=None, credential: str = PRIMARY_CREDENTIAL) -> None:
+        """Mark endpoint of credential as exhausted after 429
+
+        Args:
+            endpoint: endpoint family of the request
+            response: response of 429. Its x-rate-limit-reset is used if exists.
+            credential: name of the credential that sent the request
+        """
+        reset = None
+        if response is not None:
+            reset = response.headers.get('x-rate-limit-reset')
+        self.bucket(endpoint, credential).exhaust(float(reset) if reset is not None else None)
+
+
+RATE_LIMITS = RateLimitRegistry(RATE_LIMIT_DEFAULTS)
+register_stats('twitter_rate_limit', RATE_LIMITS.stats, labels=('credential', 'endpoint'))
+register_stats('twitter_throttle', RATE_LIMITS.throttle_stats)
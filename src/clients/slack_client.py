@@ -1,29 +1,156 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
 import requests
 
 from .mixins import SlackCredentialMixin
+from utils import (
+    SLACK_API_URL,
+    SLACK_COALESCE_WINDOW_IN_SEC,
+    SLACK_MIN_INTERVAL_PER_CHANNEL_IN_SEC,
+    SLACK_MAX_MESSAGE_LENGTH,
+)
+
+
+# Failures of slack itself cannot be reported to slack
+logger = logging.getLogger(__name__)
 
 
 class SlackBase:
     pass
 
 
-class SlackClient(SlackBase, SlackCredentialMixin):
+class SlackNotifier:
+    """Background worker that posts queued messages to slack
+
+    Notes:
+        Messages queued within coalesce_window_in_sec are joined per channel into one post.
+        Each channel is posted at most once per min_interval_in_sec.
+        Posts reuse the connections of a single requests.Session.
+        The worker thread starts with the first message and the queue is flushed at exit.
+    """
+
+    def __init__(
+            self,
+            url: str = SLACK_API_URL,
+            coalesce_window_in_sec: float = SLACK_COALESCE_WINDOW_IN_SEC,
+            min_interval_in_sec: float = SLACK_MIN_INTERVAL_PER_CHANNEL_IN_SEC,
+            max_message_length: int = SLACK_MAX_MESSAGE_LENGTH
+    ):
+        self.url = url
+        self._coalesce_window_in_sec = coalesce_window_in_sec
+        self._min_interval_in_sec = min_interval_in_sec
+        self._max_message_length = max_message_length
+        self._queue: queue.Queue = queue.Queue()
+        self._last_sent: Dict[str, float] = {}
+        self._session: Optional[requests.Session] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, token: str, channel: str, headers: Dict[str, str], message: str) -> None:
+        self._start_unless_started()
+        self._queue.put((token, channel, headers, message))
+
+    def flush(self, timeout_in_sec: float = 10.0) -> None:
+        """Wait until every queued message has been posted"""
+        deadline = time.time() + timeout_in_sec
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+
+    def _start_unless_started(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._session = requests.Session()
+            self._thread = threading.Thread(target=self._run, name='slack-notifier', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            time.sleep(self._coalesce_window_in_sec)
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            messages_by_channel: Dict[Tuple[str, str], List[str]] = {}
+            headers_by_channel: Dict[Tuple[str, str], Dict[str, str]] = {}
+            for token, channel, headers, message in items:
+                messages_by_channel.setdefault((token, channel), []).append(message)
+                headers_by_channel[(token, channel)] = headers
+
+            for (token, channel), messages in messages_by_channel.items():
+                for text in self._join(messages):
+                    self._post(token, channel, headers_by_channel[(token, channel)], text)
+            for _ in items:
+                self._queue.task_done()
+
+    def _join(self, messages: List[str]) -> List[str]:
+        """Join messages with newlines without exceeding max_message_length per post"""
+        texts: List[str] = []
+        current = ''
+        for message in messages:
+            message = message[:self._max_message_length]
+            if current and len(current) + len(message) + 1 > self._max_message_length:
+                texts.append(current)
+                current = ''
+            current = f'{current}\n{message}' if current else message
+        if current:
+            texts.append(current)
+        return texts
+
+    def _post(self, token: str, channel: str, headers: Dict[str, str], text: str) -> None:
+        wait_in_sec = self._last_sent.get(channel, 0) + self._min_interval_in_sec - time.time()
+        if wait_in_sec > 0:
+            time.sleep(wait_in_sec)
 
-    def send_message(self, message):
         params = {
-            'token': self._token,
-            'channel': self._channel,
-            'text': message
+            'token': token,
+            'channel': channel,
+            'text': text
         }
+        try:
+            res = self._session.post(self.url, headers=headers, params=params)
+            if res.status_code == 429:
+                time.sleep(float(res.headers.get('Retry-After', 1)))
+                res = self._session.post(self.url, headers=headers, params=params)
+        except requests.RequestException as e:
+            # The message of e has the url with the token in it
+            logger.warning('Failed to post to %s: %s', channel, type(e).__name__)
+            return
+        finally:
+            self._last_sent[channel] = time.time()
+
+        try:
+            body = res.json()
+        except ValueError:
+            body = {}
+        if not body.get('ok'):
+            logger.warning(
+                'Slack rejected a post to %s: status %s, error %s',
+                channel, res.status_code, body.get('error')
+            )
+
+
+NOTIFIER = SlackNotifier()
+
+
+class SlackClient(SlackBase, SlackCredentialMixin):
+
+    def send_message(self, message):
+        """Queue message. It is posted by NOTIFIER in background, so this returns immediately."""
+        NOTIFIER.enqueue(self._token, self._channel, self._headers, str(message))
 
-        res = requests.post(
-            'https://slack.com/api/chat.postMessage',
-            headers=self._headers,
-            params=params
-        )
-        if not res.json().get('ok'):
-            # TODO
-            print('add logging here')
+    @staticmethod
+    def flush() -> None:
+        NOTIFIER.flush()
 
 
 SLACK_INFO = SlackClient('#twitter_bot_info')
@@ -1,20 +1,32 @@
-import time
-from typing import Optional, Set
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
 
-import tweepy
 from tweepy import models
 from tweepy.error import RateLimitError, TweepError
 
 from .mixins import TwitterCredentialMixin
-from .utils import prevent_from_limit_error
+from .rate_limit import (
+    RATE_LIMITS,
+    SEARCH_TWEETS,
+    USERS_SHOW,
+    USERS_LOOKUP,
+    STATUSES_USER_TIMELINE,
+    FOLLOWERS_IDS,
+    FAVORITES_CREATE,
+    FAVORITES_LIST,
+)
+from .cache import CACHES
+from .ledger import LIKED_TWEETS
+from .utils import cached, make_cache_key, rate_limited, reacquire
 from .slack_client import (
     SLACK_WARNING,
     SLACK_ERROR,
 )
 from utils import (
     RETRY_NUM,
-    REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND,
+    USERS_LOOKUP_LIMIT,
 )
+from utils.functions import chunked
 
 
 class TwitterBase:
@@ -26,12 +38,7 @@ class TwitterClient(
     TwitterCredentialMixin
 ):
 
-    @prevent_from_limit_error(
-        'search',
-        '/search/tweets',
-        window_in_sec=15 * 60,
-        recovery_time_in_sec=15 * 60
-    )
+    @rate_limited(SEARCH_TWEETS)
     def fetch_tweets_by_keyword(self, **kwargs):
         """
 
@@ -39,6 +46,7 @@ class TwitterClient(
             **kwargs:
 
         Returns:
+            tweets found. None if the search failed, which is not the same as no tweets.
 
         Examples:
             TODO Fix the annotation
@@ -50,7 +58,10 @@ class TwitterClient(
             100 is the limit of tweets that can be fetched at a time.
             ref: https://developer.twitter.com/en/docs/tweets/search/api-reference/get-search-tweets
             Issue(Favorited state in search is always false):https://github.com/tweepy/tweepy/issues/1233
+            tweet_mode is extended by default, so tweets have full_text instead of the truncated text.
         """
+        if 'tweet_mode' not in kwargs.keys():
+            kwargs['tweet_mode'] = 'extended'
         if 'lang' not in kwargs.keys():
             kwargs['lang'] = 'ja'
         if 'count' not in kwargs.keys():
@@ -58,14 +69,11 @@ class TwitterClient(
         for _ in range(RETRY_NUM):
             try:
                 return self.api.search(**kwargs)
-            except RateLimitError:
-                time.sleep(REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND)
+            except RateLimitError as e:
                 SLACK_WARNING.send_message(
-                    (
-                        'WARNING: Rate limit error occurred in fetch_tweets_by_keyword'
-                        'Sleep for 15min..zzzz'
-                    )
+                    'WARNING: Rate limit error occurred in fetch_tweets_by_keyword. Wait for the reset.'
                 )
+                reacquire(self, SEARCH_TWEETS, e.response)
                 continue
             except TweepError as e:
                 if e.response is None:
@@ -75,17 +83,76 @@ class TwitterClient(
                     SLACK_WARNING.send_message(
                         f'Reason is {e.reason}'
                     )
-                    return []
+                    return None
                 raise
+        return None
 
-    @prevent_from_limit_error(
-        request_limit=15,
-        window_in_sec=15 * 60,
-        recovery_time_in_sec=15 * 60
-    )
     def like_tweet(self, **kwargs):
         """
 
+        Args:
+            **kwargs: id is required
+
+        Returns:
+            liked tweet. None if it was not liked.
+
+        Notes:
+            Tweets in LIKED_TWEETS are skipped without sending any request.
+        """
+        tweet_id: int = kwargs['id']
+        if tweet_id in LIKED_TWEETS:
+            return None
+        status = self._create_favorite(**kwargs)
+        if status is not None:
+            LIKED_TWEETS.record(tweet_id, status.user.id, datetime.now())
+        return status
+
+    def backfill_liked_tweets(self) -> int:
+        """Record tweets that this account has already liked in LIKED_TWEETS
+
+        Returns:
+            number of tweets recorded
+
+        Notes:
+            Run once when the ledger is empty. favorites/list returns up to 200 tweets per page.
+            If a page fails, the tweets of the pages before it are kept and the backfill stops.
+        """
+        num_recorded = 0
+        max_id = None
+        while True:
+            tweets = self._fetch_favorites_page(max_id)
+            if not tweets:
+                break
+            LIKED_TWEETS.record_many([
+                {'tweet_id': tweet.id, 'user_id': tweet.user.id, 'liked_at': None}
+                for tweet in tweets
+            ])
+            num_recorded += len(tweets)
+            max_id = min(tweet.id for tweet in tweets) - 1
+        return num_recorded
+
+    @rate_limited(FAVORITES_LIST)
+    def _fetch_favorites_page(self, max_id: Optional[int] = None) -> List[models.Status]:
+        kwargs = {'count': 200}
+        if max_id is not None:
+            kwargs['max_id'] = max_id
+        for _ in range(RETRY_NUM):
+            try:
+                return self.api.favorites(**kwargs)
+            except RateLimitError as e:
+                reacquire(self, FAVORITES_LIST, e.response)
+                continue
+            except TweepError as e:
+                SLACK_WARNING.send_message(
+                    f'WARNING: favorites/list failed in backfill_liked_tweets. Reason is {e.reason}'
+                )
+                return []
+        return []
+
+    @rate_limited(FAVORITES_CREATE)
+    def _create_favorite(self, **kwargs):
+        """
+
         Args:
             **kwargs:
 
@@ -108,12 +175,12 @@ class TwitterClient(
                     )
                     return None
                 if e.response.status_code == 403:
-                    # TODO: Should either get all of my favourites or save them in db.
                     SLACK_WARNING.send_message(
                         (
                             'WARNING: This tweet has been liked.'
                         )
                     )
+                    LIKED_TWEETS.record(kwargs['id'])
                     return
                 elif e.response.status_code == 404:
                     SLACK_WARNING.send_message(
@@ -125,19 +192,15 @@ class TwitterClient(
                 elif e.response.status_code == 429:
                     SLACK_ERROR.send_message(
                         (
-                            "Like request limit has been exceeded. Let's sleep 24hours"
+                            'Like request limit has been exceeded. Likes are suspended until the reset.'
                         )
                     )
-                    time.sleep(24 * 60 * 60)
+                    RATE_LIMITS.exhaust(FAVORITES_CREATE, e.response)
                     return
                 raise
 
-    @prevent_from_limit_error(
-        'users',
-        '/users/show/:id',
-        window_in_sec=15 * 60,
-        recovery_time_in_sec=15 * 60
-    )
+    @cached(USERS_SHOW)
+    @rate_limited(USERS_SHOW)
     def fetch_user_info(self, **kwargs) -> Optional[models.User]:
         """
 
@@ -152,14 +215,11 @@ class TwitterClient(
         for _ in range(RETRY_NUM):
             try:
                 return self.api.get_user(**kwargs)
-            except RateLimitError:
-                time.sleep(REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND)
+            except RateLimitError as e:
                 SLACK_WARNING.send_message(
-                    (
-                        'WARNING: Rate limit error occurred in fetch_user_info'
-                        'Sleep for 15min..zzzz'
-                    )
+                    'WARNING: Rate limit error occurred in fetch_user_info. Wait for the reset.'
                 )
+                reacquire(self, USERS_SHOW, e.response)
                 continue
             except TweepError as e:
                 if e.response is None:
@@ -176,12 +236,64 @@ class TwitterClient(
                     return None
                 raise e
 
-    @prevent_from_limit_error(
-        'statuses',
-        '/statuses/user_timeline',
-        window_in_sec=15 * 60,
-        recovery_time_in_sec=15 * 60
-    )
+    def fetch_users_info(self, user_ids: List[int]) -> List[models.User]:
+        """Fetch profiles of many users at once
+
+        Args:
+            user_ids: ids of users
+
+        Returns:
+            users that were found. Suspended or deleted users are not included.
+
+        Notes:
+            users/lookup resolves up to 100 users per request.
+            Profiles share the cache of fetch_user_info, so cached users cost no request.
+            https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-users-lookup
+        """
+        cache = CACHES.cache(USERS_SHOW)
+        users: List[models.User] = []
+        ids_to_fetch: List[int] = []
+        for id_ in user_ids:
+            is_hit, user = cache.get(make_cache_key(id=id_))
+            if is_hit:
+                users.append(user)
+            else:
+                ids_to_fetch.append(id_)
+
+        for chunk in chunked(ids_to_fetch, USERS_LOOKUP_LIMIT):
+            for user in self._lookup_users(chunk):
+                cache.set(make_cache_key(id=user.id), user)
+                users.append(user)
+        return users
+
+    @rate_limited(USERS_LOOKUP)
+    def _lookup_users(self, user_ids: List[int]) -> List[models.User]:
+        for _ in range(RETRY_NUM):
+            try:
+                return self.api.lookup_users(user_ids=user_ids)
+            except RateLimitError as e:
+                SLACK_WARNING.send_message(
+                    'WARNING: Rate limit error occurred in fetch_users_info. Wait for the reset.'
+                )
+                reacquire(self, USERS_LOOKUP, e.response)
+                continue
+            except TweepError as e:
+                if e.response is None:
+                    SLACK_WARNING.send_message(
+                        f'WARNING: None response received in fetch_users_info.'
+                    )
+                    SLACK_WARNING.send_message(
+                        f'Reason is {e.reason}'
+                    )
+                    return []
+                if e.response.status_code == 404:
+                    """None of the users exists"""
+                    return []
+                raise e
+        return []
+
+    @cached(STATUSES_USER_TIMELINE)
+    @rate_limited(STATUSES_USER_TIMELINE)
     def fetch_user_tweet(self, **kwargs) -> Optional[models.User]:
         """
 
@@ -196,9 +308,11 @@ class TwitterClient(
         for _ in range(RETRY_NUM):
             try:
                 return self.api.user_timeline(**kwargs)
-            except RateLimitError:
-                time.sleep(REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND)
-                SLACK_WARNING.send_message('WARNING: Rate limit error occurred! Sleep for 15min..zzzz')
+            except RateLimitError as e:
+                SLACK_WARNING.send_message(
+                    'WARNING: Rate limit error occurred in fetch_user_tweet. Wait for the reset.'
+                )
+                reacquire(self, STATUSES_USER_TIMELINE, e.response)
                 continue
             except TweepError as e:
                 if e.response is None:
@@ -215,24 +329,44 @@ class TwitterClient(
                     return None
                 raise e
 
-    @prevent_from_limit_error(
-        'followers',
-        '/followers/ids',
-        window_in_sec=15 * 60,
-        recovery_time_in_sec=15 * 60
-    )
-    def fetch_user_follower_ids(self, user_id: str) -> Set[int]:
-        followers_ids_iter = tweepy.Cursor(self.api.followers_ids, id=user_id).pages()
-        all_ids: Set[int] = set()
-        while True:
+    def iter_user_follower_id_pages(self, user_id: str, cursor: int = -1) -> Iterator[Tuple[List[int], int]]:
+        """Yield follower ids page by page as they arrive
+
+        Args:
+            user_id: target user
+            cursor: cursor of the first page. -1 means the beginning.
+
+        Yields:
+            (ids, next_cursor). next_cursor is 0 after the last page.
+        """
+        while cursor != 0:
+            ids, cursor = self.fetch_user_follower_ids_page(user_id=user_id, cursor=cursor)
+            yield ids, cursor
+
+    @rate_limited(FOLLOWERS_IDS)
+    def fetch_user_follower_ids_page(self, user_id: str, cursor: int = -1) -> Tuple[List[int], int]:
+        """Fetch one page(up to 5000 ids) of followers
+
+        Returns:
+            (ids, next_cursor). next_cursor is 0 if this is the last page.
+
+        Raises:
+            TweepError: if the page could not be fetched. Callers keep cursor and retry later,
+                because an empty page with next_cursor 0 would look like the end of the followers.
+
+        Notes:
+            https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-followers-ids
+        """
+        for _ in range(RETRY_NUM):
             try:
-                ids = next(followers_ids_iter)
-            except RateLimitError:
-                time.sleep(REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND)
-                SLACK_WARNING.send_message('WARNING: Rate limit error occurred! Sleep for 15min..zzzz')
+                ids, (_, next_cursor) = self.api.followers_ids(id=user_id, cursor=cursor)
+                return ids, next_cursor
+            except RateLimitError as e:
+                SLACK_WARNING.send_message(
+                    'WARNING: Rate limit error occurred in fetch_user_follower_ids. Wait for the reset.'
+                )
+                reacquire(self, FOLLOWERS_IDS, e.response)
                 continue
-            except StopIteration:
-                break
             except TweepError as e:
                 if e.response is None:
                     SLACK_WARNING.send_message(
@@ -241,13 +375,9 @@ class TwitterClient(
                     SLACK_WARNING.send_message(
                         f'Reason is {e.reason}'
                     )
-                    return all_ids
+                    raise e
                 if e.response.status_code == 401:
                     """ID that does not exist"""
                     SLACK_ERROR.send_message(f'ID:{user_id} does not exist')
                 raise e
-
-            for id_ in ids:
-                all_ids.add(id_)
-
-        return all_ids
+        raise TweepError(f'Rate limit error occurred {RETRY_NUM} times in fetch_user_follower_ids of {user_id}')
@@ -1,95 +1,90 @@
-from datetime import datetime
 from functools import wraps
 import time
 
-from tweepy.error import RateLimitError
+from utils.metrics import TWITTER_REQUESTS, TWITTER_REQUEST_SECONDS
 
-from .slack_client import (
-    SLACK_WARNING,
-)
-from .mixins import TwitterCredentialMixin as Twitter
-from utils import (
-    RETRY_NUM,
-    REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND,
-)
+from .cache import CACHES
+from .rate_limit import RATE_LIMITS
 
 
-def prevent_from_limit_error(
-        *args_,
-        request_limit: int = 15,
-        window_in_sec: int = 15 * 60,
-        recovery_time_in_sec: int = 15 * 60
-):
+def make_cache_key(**kwargs) -> str:
+    return ','.join(f'{k}={v}' for k, v in sorted(kwargs.items()))
+
+
+def rate_limited(endpoint: str):
+    """Take a permit of endpoint before the call and sync the quota with the response headers
+
+    Args:
+        endpoint: endpoint family such as '/search/tweets'
+
+    Notes:
+        The decorated method has to belong to TwitterCredentialMixin because the
+        response headers are read from api.last_response.
+        The call is sent with the credential that got the permit. Read endpoints can use
+        any credential of the pool and the others use the primary one.
+        Calls are counted by the status of the last response and their latency is recorded.
+    """
     def decorator(func):
-        cache = {}
 
         @wraps(func)
-        def wrapper(*args, **kwargs):
-            elapsed = time.time() - cache['previous_call']
-            is_too_soon = elapsed < window_in_sec
-            is_too_many = cache['num_called'] >= cache['remaining']
-            is_exceeded_request_limit: bool = is_too_soon and is_too_many
-            if is_exceeded_request_limit:
-                now_in_unix = datetime.now().timestamp()
-                recovery_time_in_sec_ = fetch_request_limit(*args_)['reset'] - now_in_unix \
-                    if len(args_) != 0 else recovery_time_in_sec
-
-                SLACK_WARNING.send_message(
-                    (
-                        f'Too many requests for {func.__name__}'
-                        f"let's sleep {recovery_time_in_sec_} seconds."
-                    )
-                )
-                time.sleep(recovery_time_in_sec_)
-                cache['num_called'] = 0
-            cache['previous_call'] = time.time()
-            cache['num_called'] += 1
-            cache['remaining'] = cache['request_limit'] - cache['num_called']
-            print(f'{func.__name__}_cache_inside: {cache}')
-            return func(*args, **kwargs)
-
-        cache = {
-            'num_called': 0,
-            'previous_call': time.time(),
-            'request_limit': fetch_request_limit(*args_)['limit'] if len(args_) != 0 else request_limit,
-            'remaining': fetch_request_limit(*args_)['remaining'] if len(args_) != 0 else request_limit,
-        }
-        print(f'{func.__name__}_cache_outside: {cache}')
+        def wrapper(self, *args, **kwargs):
+            credential = RATE_LIMITS.acquire(endpoint, self.credentials.names_for(endpoint))
+            with self.use_credential(credential):
+                started_at = time.perf_counter()
+                try:
+                    return func(self, *args, **kwargs)
+                finally:
+                    TWITTER_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started_at)
+                    response = getattr(self.api, 'last_response', None)
+                    TWITTER_REQUESTS.labels(
+                        endpoint,
+                        response.status_code if response is not None else 'none'
+                    ).inc()
+                    RATE_LIMITS.update_from_response(endpoint, response, self.current_credential)
+
         return wrapper
 
-    def fetch_request_limit(*args):
-        """
-
-        Returns:
-
-        Notes:
-            API Document xxx
-
-        """
-
-        for _ in range(RETRY_NUM):
-            try:
-                status = Twitter().api.rate_limit_status()
-            except RateLimitError:
-                SLACK_WARNING.send_message(
-                    (
-                        'WARNING: Woops Rate limit (fetch_request_limit_remaining in Base) '
-                        'error occurred! Sleep for 15min..zzzz'
-                    )
-                )
-                time.sleep(REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND)
-                continue
-            break
-
-        if len(args) == 0:
-            return status
-
-        outer = status.get('resources', {})
-        for target in args:
-            inner = outer.get(target, None)
-            if inner is None:
-                break
-            outer = inner
-        return inner
+    return decorator
+
+
+def reacquire(client, endpoint: str, response) -> None:
+    """Exhaust the current credential after 429 and switch to a credential that has a permit
+
+    Args:
+        client: TwitterCredentialMixin inside a call decorated by rate_limited
+        endpoint: endpoint family of the request
+        response: response of 429
+    """
+    RATE_LIMITS.exhaust(endpoint, response, client.current_credential)
+    credential = RATE_LIMITS.acquire(endpoint, client.credentials.names_for(endpoint))
+    # use_credential of rate_limited restores the previous credential when the call ends
+    client.switch_credential(credential)
+
+
+def cached(endpoint: str):
+    """Return the response from the cache of endpoint if it has not expired
+
+    Args:
+        endpoint: endpoint family such as '/users/show/:id'
+
+    Notes:
+        Only keyword arguments are used as a key. None is not cached because it means an error.
+        Put this above rate_limited so that hits do not consume the quota.
+    """
+    def decorator(func):
+
+        @wraps(func)
+        def wrapper(self, **kwargs):
+            cache = CACHES.cache(endpoint)
+            key = make_cache_key(**kwargs)
+            is_hit, value = cache.get(key)
+            if is_hit:
+                return value
+            value = func(self, **kwargs)
+            if value is not None:
+                cache.set(key, value)
+            return value
+
+        return wrapper
 
     return decorator
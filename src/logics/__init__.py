@@ -1,7 +1,9 @@
 from .like_logic import LikeLogic
 from .user_logic import UserLogic
+from .worker_logic import WorkerLogic
 
 __all__ = [
     'UserLogic',
-    'LikeLogic'
+    'LikeLogic',
+    'WorkerLogic',
 ]
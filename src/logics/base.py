@@ -1,50 +1,72 @@
+import asyncio
 from dataclasses import dataclass
-from typing import List, Iterable, Union
+from typing import List, Iterable, Set, Union
 
-from sqlalchemy.orm import sessionmaker
 from tweepy.models import User as user_account
 
-from utils import ENGINE
-from clients import TwitterClient
+from utils import session_scope, EXISTENCE_CHECK_CHUNK_SIZE, USE_KNOWN_USER_INDEX, EVALUATE_WORKERS
+from utils.functions import LazyAttribute
+from utils.id_index import KnownIdIndex
+from clients import AsyncTwitterClient
 from models import ValuableUsers
-from .evaluate import Evaluate
+from models.users import bulk_insert_valuable_users, fetch_existing_user_ids
+from .evaluate import Evaluate, Evaluation
 
 
 @dataclass
 class LogicBase:
-    twitter = TwitterClient()
-    evaluate = Evaluate()
+    twitter = LazyAttribute(AsyncTwitterClient)
+    evaluate = LazyAttribute(Evaluate)
+    known_users = KnownIdIndex()
 
-    @property
-    def get_session(self):
-        session = sessionmaker(bind=ENGINE)
-        return session()
+    def load_known_users(self) -> None:
+        """Load every user id in db into known_users"""
+        with session_scope() as session:
+            rows = session.query(ValuableUsers.user_id).yield_per(EXISTENCE_CHECK_CHUNK_SIZE)
+            self.known_users.load(row.user_id for row in rows)
 
     def filter_by_existence_in_database(
             self,
-            users: Iterable[Union[int, user_account]]
+            users: Iterable[Union[int, user_account]],
+            use_index: bool = USE_KNOWN_USER_INDEX
     ) -> List[Union[int, user_account]]:
         """filter lists by checking if they are in db
 
         Args:
-            users:
+            users: user ids or user objects
+            use_index: skip db lookups for ids that are already in known_users
 
         Returns:
+            users that are not in db. The order of users is kept.
 
+        Notes:
+            Ids are checked in chunks of EXISTENCE_CHECK_CHUNK_SIZE instead of one query per id.
         """
-        session = self.get_session
-        filtered_ids: List[Union[int, user_account]] = []
-        for id_ in users:
-            if isinstance(id_, int):
-                user_in_db = session.query(ValuableUsers).filter(ValuableUsers.user_id == id_).first()
-            else:
-                # TODO: fix this later
-                user_in_db = session.query(ValuableUsers).filter(ValuableUsers.user_id == id_.id).first()
-            if user_in_db is not None:
-                continue
-            filtered_ids.append(id_)
-        session.close()
-        return filtered_ids
+        if use_index and not self.known_users.is_loaded:
+            self.load_known_users()
+
+        candidates = [
+            (id_ if isinstance(id_, int) else id_.id, id_)
+            for id_ in users
+        ]
+        if use_index and candidates:
+            is_known = self.known_users.contains_many([id_ for id_, _ in candidates])
+            candidates = [
+                candidate
+                for candidate, known in zip(candidates, is_known.tolist())
+                if not known
+            ]
+
+        with session_scope() as session:
+            existing_ids: Set[int] = fetch_existing_user_ids(session, {id_ for id_, _ in candidates})
+        if use_index:
+            self.known_users.add_many(existing_ids)
+
+        return [
+            user
+            for id_, user in candidates
+            if id_ not in existing_ids
+        ]
 
     def save_new_users(self, target_all: List[user_account], num_likes: int = 0) -> None:
         """Save users in target_all
@@ -55,22 +77,20 @@ class LogicBase:
 
         Notes:
             table: user_id(integer) screen_name(str) is_friend(boolean) num_likes(int)
+            Users that already exist are skipped by db, so no existence check is needed.
         """
-        session = self.get_session
-        new_accounts: List[user_account] = self.filter_by_existence_in_database(target_all)
-        for new_account in new_accounts:
-            screen_name: str = new_account.name
-            id_: int = new_account.id
-            is_friend: bool = new_account.following
-            vu = ValuableUsers(
-                user_id=id_,
-                screen_name=screen_name,
-                is_friend=is_friend,
-                num_likes=num_likes
-            )
-            session.add(vu)
-        session.commit()
-        session.close()
+        rows = [
+            {
+                'id': account.id,
+                'screen_name': account.name,
+                'is_friend': account.following,
+                'num_likes': num_likes,
+            }
+            for account in target_all
+        ]
+        with session_scope() as session:
+            bulk_insert_valuable_users(session, rows)
+        self.known_users.add_many(row['id'] for row in rows)
 
     def update_db(self, model_object, *, search_key: str, **kwargs) -> None:
         """Update object
@@ -81,13 +101,33 @@ class LogicBase:
             kwargs (Dict[str, Any]): things to update key: column name value: value to update
 
         """
-        session = self.get_session
         search_ = getattr(model_object, search_key)
-        model_ = session.query(model_object).filter(search_ == kwargs[search_key]).first()
-        for k, v in kwargs.items():
-            setattr(model_, k, v)
-        session.commit()
-        session.close()
+        with session_scope() as session:
+            model_ = session.query(model_object).filter(search_ == kwargs[search_key]).first()
+            for k, v in kwargs.items():
+                setattr(model_, k, v)
+
+    async def evaluate_users_concurrently(
+            self,
+            users: List[Union[int, user_account]],
+            num_workers: int = EVALUATE_WORKERS
+    ) -> List[Evaluation]:
+        """Evaluate users with at most num_workers evaluations in flight
+
+        Args:
+            users: user ids or user objects
+            num_workers: max number of users evaluated at the same time
+
+        Returns:
+            evaluations in the same order as users
+        """
+        semaphore = asyncio.Semaphore(num_workers)
+
+        async def evaluate(user: Union[int, user_account]) -> Evaluation:
+            async with semaphore:
+                return await self.evaluate.evaluate_user(user)
+
+        return list(await asyncio.gather(*(evaluate(user) for user in users)))
 
     @classmethod
     async def main(cls, *args, **kwargs):
@@ -1,44 +1,78 @@
 from datetime import datetime, timedelta
 from dataclasses import dataclass
-from typing import Union
+from typing import List, NamedTuple, Optional, Union
 
+import numpy as np
 from tweepy.models import User as user_account
 
-from clients import TwitterClient
+from clients import AsyncTwitterClient
+from utils.functions import LazyAttribute
+from utils.settings import (
+    EVALUATE_MIN_FOLLOWERS,
+    EVALUATE_MIN_FRIENDS,
+    EVALUATE_MIN_FAVOURITES,
+    EVALUATE_MIN_DESCRIPTION_LENGTH,
+    EVALUATE_ACTIVE_WITHIN_DAYS,
+    EVALUATE_MAX_FAVORITE_COUNT,
+    EVALUATE_MAX_RETWEET_COUNT,
+)
+
+
+class Evaluation(NamedTuple):
+    """Result of evaluating a user"""
+    user: Optional[user_account]
+    tweets: Optional[list]
+    verdict: bool
+    reason: str
 
 
 @dataclass
 class Evaluate:
-    twitter = TwitterClient()
-    user_info_cache: user_account = None
-    tweet_info_cache = None
+    """Predicates to judge users and tweets
+
+    Notes:
+        Evaluate holds no state of the user being evaluated,
+        so one instance can evaluate many users concurrently.
+    """
+    twitter = LazyAttribute(AsyncTwitterClient)
+
+    async def evaluate_user(self, user_info: Union[int, user_account], tweets=None) -> Evaluation:
+        """Judge if the user is worth saving
+
+        Args:
+            user_info: user id or user object
+            tweets: latest tweets of the user. Fetched from user_timeline if None.
 
-    def is_valuable_user(self, user_info: Union[int, user_account], tweets=None) -> bool:
+        Returns:
+            Evaluation whose reason is the first failed check or 'valuable'
+        """
         if isinstance(user_info, int):
-            user_info = self.twitter.fetch_user_info(id=user_info)
-        self.user_info_cache = user_info
-        if self.user_info_cache is None:
-            return False
+            user_info = await self.twitter.fetch_user_info(id=user_info)
+        if user_info is None:
+            return Evaluation(None, None, False, 'not_found')
 
         if tweets is None:
-            tweets = self.twitter.fetch_user_tweet(id=self.user_info_cache.id)
-        self.tweet_info_cache = tweets
+            tweets = await self.twitter.fetch_user_tweet(id=user_info.id)
         if tweets is None:
-            return False
+            return Evaluation(user_info, None, False, 'no_timeline')
 
-        if not self.is_reliable(self.user_info_cache):
-            return False
+        if not self.is_reliable(user_info):
+            return Evaluation(user_info, tweets, False, 'unreliable')
 
-        if not self.has_valuable_description(self.user_info_cache):
-            return False
+        if not self.has_valuable_description(user_info):
+            return Evaluation(user_info, tweets, False, 'poor_description')
 
-        if not self.is_active(self.tweet_info_cache):
-            return False
+        if not self.is_active(tweets):
+            return Evaluation(user_info, tweets, False, 'inactive')
 
-        if self.is_business_account(self.user_info_cache):
-            return False
+        if self.is_business_account(user_info):
+            return Evaluation(user_info, tweets, False, 'business_account')
 
-        return True
+        return Evaluation(user_info, tweets, True, 'valuable')
+
+    async def is_valuable_user(self, user_info: Union[int, user_account], tweets=None) -> bool:
+        evaluation = await self.evaluate_user(user_info, tweets)
+        return evaluation.verdict
 
     @staticmethod
     def is_active(tweets) -> bool:
@@ -49,22 +83,22 @@ class Evaluate:
         if not has_tweets:
             return False
 
-        three_days_ago: datetime = datetime.now() - timedelta(days=30)
-        return three_days_ago < tweets[0].created_at
+        active_since: datetime = datetime.now() - timedelta(days=EVALUATE_ACTIVE_WITHIN_DAYS)
+        return active_since < tweets[0].created_at
 
     @staticmethod
     def has_valuable_description(user: user_account) -> bool:
-        if len(user.description) < 10:
+        if len(user.description) < EVALUATE_MIN_DESCRIPTION_LENGTH:
             return False
         return True
 
     @staticmethod
     def is_reliable(user: user_account) -> bool:
-        if user.followers_count < 10:
+        if user.followers_count < EVALUATE_MIN_FOLLOWERS:
             return False
-        if user.friends_count < 10:
+        if user.friends_count < EVALUATE_MIN_FRIENDS:
             return False
-        if user.favourites_count < 10:
+        if user.favourites_count < EVALUATE_MIN_FAVOURITES:
             return False
         if user.protected:
             return False
@@ -77,7 +111,7 @@ class Evaluate:
             return False
         if tweet.favorited or tweet.retweeted:
             return False
-        if tweet.favorite_count > 10 or tweet.retweet_count > 10:
+        if tweet.favorite_count > EVALUATE_MAX_FAVORITE_COUNT or tweet.retweet_count > EVALUATE_MAX_RETWEET_COUNT:
             return False
         return True
 
@@ -95,3 +129,62 @@ class Evaluate:
             if self.is_likable(target_tweet):
                 return target_tweet
         return None
+
+    @staticmethod
+    def evaluate_users(
+            users: List[user_account],
+            last_tweeted_at: Optional[List[Optional[datetime]]] = None
+    ) -> np.ndarray:
+        """Evaluate a page of users at once
+
+        Args:
+            users: users of a users/lookup page or authors of a search page
+            last_tweeted_at: created_at of the latest tweet of each user. None skips is_active.
+
+        Returns:
+            bool array. True means is_reliable, has_valuable_description, not is_business_account
+            and, if last_tweeted_at is given, is_active.
+        """
+        count = len(users)
+        followers = np.fromiter((user.followers_count for user in users), dtype=np.int64, count=count)
+        friends = np.fromiter((user.friends_count for user in users), dtype=np.int64, count=count)
+        favourites = np.fromiter((user.favourites_count for user in users), dtype=np.int64, count=count)
+        protected = np.fromiter((user.protected for user in users), dtype=np.bool_, count=count)
+        verified = np.fromiter((user.verified for user in users), dtype=np.bool_, count=count)
+        description_length = np.fromiter(
+            (len(user.description or '') for user in users), dtype=np.int64, count=count
+        )
+
+        is_valuable = (followers >= EVALUATE_MIN_FOLLOWERS) \
+            & (friends >= EVALUATE_MIN_FRIENDS) \
+            & (favourites >= EVALUATE_MIN_FAVOURITES) \
+            & ~protected \
+            & (description_length >= EVALUATE_MIN_DESCRIPTION_LENGTH) \
+            & ~verified
+
+        if last_tweeted_at is not None:
+            active_since = (datetime.now() - timedelta(days=EVALUATE_ACTIVE_WITHIN_DAYS)).timestamp()
+            timestamps = np.fromiter(
+                (created_at.timestamp() if created_at is not None else np.nan for created_at in last_tweeted_at),
+                dtype=np.float64,
+                count=count
+            )
+            is_valuable &= timestamps > active_since
+        return is_valuable
+
+    @staticmethod
+    def evaluate_tweets(tweets) -> np.ndarray:
+        """Evaluate is_likable of a page of tweets at once
+
+        Returns:
+            bool array. True means the tweet is likable.
+        """
+        count = len(tweets)
+        favorited = np.fromiter((tweet.favorited for tweet in tweets), dtype=np.bool_, count=count)
+        retweeted = np.fromiter((tweet.retweeted for tweet in tweets), dtype=np.bool_, count=count)
+        favorite_count = np.fromiter((tweet.favorite_count for tweet in tweets), dtype=np.int64, count=count)
+        retweet_count = np.fromiter((tweet.retweet_count for tweet in tweets), dtype=np.int64, count=count)
+        return ~favorited \
+            & ~retweeted \
+            & (favorite_count <= EVALUATE_MAX_FAVORITE_COUNT) \
+            & (retweet_count <= EVALUATE_MAX_RETWEET_COUNT)
@@ -0,0 +1,57 @@
+import atexit
+import threading
+import time
+from typing import Dict
+
+from models.users import increment_num_likes
+from utils import (
+    session_scope,
+    LIKE_COUNTER_FLUSH_THRESHOLD,
+    LIKE_COUNTER_FLUSH_INTERVAL_IN_SEC,
+)
+
+
+class LikeCounterBuffer:
+    """Write-behind buffer of num_likes increments
+
+    Notes:
+        Increments are summed per user in memory and written by one UPDATE when
+        flush_threshold users are buffered, flush_interval_in_sec has passed or flush is called.
+        The buffer is flushed at exit.
+    """
+
+    def __init__(
+            self,
+            flush_threshold: int = LIKE_COUNTER_FLUSH_THRESHOLD,
+            flush_interval_in_sec: float = LIKE_COUNTER_FLUSH_INTERVAL_IN_SEC
+    ):
+        self._flush_threshold = flush_threshold
+        self._flush_interval_in_sec = flush_interval_in_sec
+        self._deltas: Dict[int, int] = {}
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def add(self, id_: int, delta: int = 1) -> None:
+        with self._lock:
+            self._deltas[id_] = self._deltas.get(id_, 0) + delta
+            should_flush = len(self._deltas) >= self._flush_threshold \
+                or time.time() - self._last_flush >= self._flush_interval_in_sec
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+            self._last_flush = time.time()
+        if len(deltas) == 0:
+            return
+
+        try:
+            with session_scope() as session:
+                increment_num_likes(session, deltas)
+        except Exception:
+            with self._lock:
+                for id_, delta in deltas.items():
+                    self._deltas[id_] = self._deltas.get(id_, 0) + delta
+            raise
@@ -1,43 +1,61 @@
 import asyncio
 from dataclasses import dataclass
-from typing import List, Tuple
+from datetime import datetime
+from typing import Dict, List, Tuple
 import random
 
+from sqlalchemy import BigInteger, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
 from tweepy.models import User as user_account
 from tweepy.error import TweepError
 
 from models import ValuableUsers
+from models.search_watermarks import Watermark, fetch_watermarks, save_watermarks
 from clients import (
+    LIKED_TWEETS,
     SLACK_INFO,
     SLACK_WARNING,
     SLACK_ERROR,
 )
 from utils.settings import (
     TARGET_KEYWORD_AND_IMPORTANCE,
-    DUMPED_FILE,
     DB_LIKES,
-    LIKE_LIMIT_PER_DAY,
+    LIKE_BUDGET_RETRY_IN_SEC,
+    SEARCH_PAGES_PER_PLAN,
 )
+from utils.database import session_scope
+from utils.functions import LazyAttribute, split_by_weights
+from utils.metrics import LIKES, PIPELINE_USERS
 from .base import LogicBase
+from .like_counter import LikeCounterBuffer
+from .like_scheduler import LikeScheduler
+from .search_planner import SearchPlan, advance_watermark, demultiplex, plan_searches
 from .errors import LogicError
 
 
 @dataclass
 class LikeLogic(LogicBase):
-    total_likes: int = 0
+    like_counter = LazyAttribute(LikeCounterBuffer)
+    like_scheduler = LazyAttribute(LikeScheduler)
 
     def fetch_users_with_likes_less_than_threshold_from_db(
             self,
             data_num: int = 50,
             threshold_likes: int = 3
     ) -> List[ValuableUsers]:
-        """
+        """Pick users to like from db
 
         Args:
-            data_num:
-            threshold_likes:
+            data_num: max number of users
+            threshold_likes: users who have been liked this number of times or more are not picked
 
         Returns:
+            users with the fewest likes. Users with the same number of likes are
+            ordered by last_checked_at, oldest(or never checked) first.
+
+        Notes:
+            The ordering and LIMIT are done by db with ix_valuable_users_num_likes_last_checked_at,
+            so the cost does not depend on the number of users in db.
 
         Examples:
             >>> users = LikeBot().fetch_users_with_likes_less_than_threshold_from_db(data_num=10)
@@ -52,36 +70,43 @@ class LikeLogic(LogicBase):
             >>> users[0].num_likes
             0
         """
-        session = self.get_session
-        target_users: List[int] = []
-
-        for threshold in range(threshold_likes):
-            users_in_db: List[ValuableUsers] = session.query(ValuableUsers).filter(
-                ValuableUsers.num_likes == threshold).all()
-            target_users.extend(users_in_db[:data_num])
-            if len(target_users[:data_num]) == data_num:
-                session.close()
-                return users_in_db[:data_num]
-
-        SLACK_WARNING.send_message(
-            'There is not enough number of users to like. Update user database immediately.'
-        )
-        session.close()
+        with session_scope() as session:
+            target_users: List[ValuableUsers] = session.query(ValuableUsers).filter(
+                ValuableUsers.num_likes < threshold_likes
+            ).order_by(
+                ValuableUsers.num_likes,
+                ValuableUsers.last_checked_at.asc().nullsfirst()
+            ).limit(data_num).all()
+
+        if len(target_users) < data_num:
+            SLACK_WARNING.send_message(
+                'There is not enough number of users to like. Update user database immediately.'
+            )
         return target_users
 
+    def mark_users_checked_in_db(self, ids: List[int]) -> None:
+        """Move users to the end of the candidate rotation
+
+        Args:
+            ids: user ids that have been picked as like candidates
+        """
+        with session_scope() as session:
+            session.query(ValuableUsers).filter(
+                ValuableUsers.user_id == any_(bindparam('ids', value=ids, type_=ARRAY(BigInteger)))
+            ).update({ValuableUsers.last_checked_at: datetime.now()}, synchronize_session=False)
+
     def increment_num_like_of_user_in_db(self, id_: int) -> None:
         """Increased number of likes of user in db
 
         Args:
             id_: user id that has already been registered in db
 
+        Notes:
+            The increment is buffered in like_counter and written with other increments at once.
         """
-        session = self.get_session
-        user_model = session.query(ValuableUsers).filter(ValuableUsers.user_id == id_).first()
-        user_model.num_likes += 1
-        session.commit()
+        self.like_counter.add(id_)
 
-    def like_tweet_from_users_in_db(self, data_num: int):
+    async def like_tweet_from_users_in_db(self, data_num: int):
         """like tweets of users that are saved in db
 
         Args:
@@ -98,27 +123,124 @@ class LikeLogic(LogicBase):
         SLACK_INFO.send_message(
             f'2/3: number of fetched users from db in like_tweet_from_users_in_db: {len(users)}'
         )
+        PIPELINE_USERS.labels('db_users', 'fetched').inc(len(users))
+        checked_user_ids: List[int] = []
         for user in users:
-            tweets = self.twitter.fetch_user_tweet(id=user.user_id)
-            likable_tweet = self.evaluate.find_likable_tweet(tweets)
-            if likable_tweet is None:
-                continue
-            self.twitter.like_tweet(id=likable_tweet.id)
-            self.increment_num_like_of_user_in_db(id_=user.user_id)
-            self.total_likes += 1
-            total_like_tweets += 1
+            if self.like_scheduler.remaining() == 0:
+                break
+            if await self.like_user_in_db(user.user_id):
+                total_like_tweets += 1
+            checked_user_ids.append(user.user_id)
+        self.like_counter.flush()
+        # Users left by the budget stay at the head of the rotation
+        self.mark_users_checked_in_db(checked_user_ids)
         SLACK_INFO.send_message(f'{total_like_tweets} tweets have been liked.')
 
-    def like_from_keyword(self, search_word: str, num_to_like: int):
+    async def like_user_in_db(self, user_id: int) -> bool:
+        """Like the latest likable tweet of a user saved in db
+
+        Args:
+            user_id: user id that has already been registered in db
+
+        Returns:
+            True if a tweet has been liked
+        """
+        tweets = await self.twitter.fetch_user_tweet(id=user_id)
+        if tweets is not None:
+            tweets = [tweet for tweet in tweets if tweet.id not in LIKED_TWEETS]
+        likable_tweet = self.evaluate.find_likable_tweet(tweets)
+        if likable_tweet is None:
+            return False
+        if not await self.like_scheduler.acquire():
+            return False
+        status = await self.twitter.like_tweet(id=likable_tweet.id)
+        if status is None:
+            self.like_scheduler.release()
+            return False
+        self.increment_num_like_of_user_in_db(id_=user_id)
+        LIKES.labels('db_users').inc()
+        return True
+
+    async def search_tweets_of_plan(
+            self,
+            plan: SearchPlan,
+            num_pages: int = SEARCH_PAGES_PER_PLAN
+    ) -> Tuple[Dict[str, list], Dict[str, Watermark]]:
+        """Search unread tweets of several keywords by one combined query
+
+        Args:
+            plan: combined query and its keywords
+            num_pages: number of result pages(100 tweets each) to fetch
+
+        Returns:
+            keyword -> tweets that match the keyword and have not been read,
+            and keyword -> watermark to save after the tweets have been processed
+
+        Notes:
+            The query is sent with since_id of the oldest watermark among the keywords.
+            If a keyword has a gap left by a previous search, the search walks down from the top of the gap.
+            The walk reached since_id only if a page came back short or empty.
+            Otherwise the tweets below the oldest page are kept as a gap in the watermarks.
+        """
+        with session_scope() as session:
+            watermarks: Dict[str, Watermark] = fetch_watermarks(session, plan.keywords)
+        since_id = min(watermark.since_id for watermark in watermarks.values()) \
+            if len(watermarks) == len(plan.keywords) else None
+        gap_max_ids = [watermark.gap_max_id for watermark in watermarks.values() if watermark.has_gap]
+        walk_max_id = max(gap_max_ids) if gap_max_ids else None
+
+        tweets = []
+        max_id = walk_max_id
+        has_reached_since_id = False
+        for _ in range(num_pages):
+            kwargs = {'q': plan.query, 'count': 100}
+            if since_id is not None:
+                kwargs['since_id'] = since_id
+            if max_id is not None:
+                kwargs['max_id'] = max_id
+            page = await self.twitter.fetch_tweets_by_keyword(**kwargs)
+            if page is None:
+                # Failed. Tweets below max_id stay unread.
+                break
+            if page:
+                tweets.extend(page)
+                max_id = min(tweet.id for tweet in page) - 1
+            if len(page) < kwargs['count']:
+                has_reached_since_id = True
+                break
+        walk_since_id = (since_id or 0) if has_reached_since_id else max_id
+
+        newest_id = max(tweet.id for tweet in tweets) if tweets else None
+        new_watermarks: Dict[str, Watermark] = {}
+        for keyword in plan.keywords:
+            if walk_since_id is None:
+                break
+            new_watermark = advance_watermark(watermarks.get(keyword), walk_max_id, walk_since_id, newest_id)
+            if new_watermark is not None and new_watermark != watermarks.get(keyword):
+                new_watermarks[keyword] = new_watermark
+
+        tweets_by_keyword = demultiplex(tweets, plan.keywords)
+        return {
+            keyword: [
+                tweet
+                for tweet in keyword_tweets
+                if keyword not in watermarks or watermarks[keyword].is_unread(tweet.id)
+            ]
+            for keyword, keyword_tweets in tweets_by_keyword.items()
+        }, new_watermarks
+
+    async def like_from_keyword(self, search_word: str, num_to_like: int, tweets=None):
         """like tweets searched by a keyword and save their owner's data
 
         Args:
             search_word: keyword to search tweets
             num_to_like: number of likes to execute
+            tweets: tweets of search_word already fetched by search_tweets_of_plan. Searched if None.
 
         """
         SLACK_INFO.send_message(f'1/5: Fetch tweets by search_word「{search_word}」num_to_like: {num_to_like}')
-        tweets = self.twitter.fetch_tweets_by_keyword(q=search_word, count=100)
+        if tweets is None:
+            tweets = await self.twitter.fetch_tweets_by_keyword(q=search_word, count=100) or []
 
         all_user_ids: List[int] = [
             tweet.author.id
@@ -132,20 +254,27 @@ class LikeLogic(LogicBase):
         ]
 
         SLACK_INFO.send_message(f"2/5: filter {len(tweets)}tweets based on user's value")
+        PIPELINE_USERS.labels('keyword', 'evaluated').inc(len(tweets))
+        is_valuable = self.evaluate.evaluate_users(
+            [tweet.author for tweet in tweets],
+            [tweet.created_at for tweet in tweets]
+        )
         filtered_tweets_by_user_info = [
             tweet
-            for tweet in tweets
-            if self.evaluate.is_valuable_user(tweet.author, [tweet])
+            for tweet, is_valuable_author in zip(tweets, is_valuable)
+            if is_valuable_author
             if tweet.author.id not in duplicate_user_ids
         ]
 
         SLACK_INFO.send_message(
             f"3/5: filter {len(filtered_tweets_by_user_info)}tweets based on tweet's likability"
         )
+        is_likable = self.evaluate.evaluate_tweets(filtered_tweets_by_user_info)
         filtered_tweets_by_likability = [
             tweet
-            for tweet in filtered_tweets_by_user_info
-            if self.evaluate.is_likable(tweet)
+            for tweet, is_likable_tweet in zip(filtered_tweets_by_user_info, is_likable)
+            if is_likable_tweet
+            if tweet.id not in LIKED_TWEETS
         ]
 
         target_tweets_to_like = filtered_tweets_by_likability[:num_to_like]
@@ -158,27 +287,77 @@ class LikeLogic(LogicBase):
         SLACK_INFO.send_message(f"4/5: Like them all {len(target_tweets_to_like)}")
         users_to_save: List[user_account] = []
         for tweet in target_tweets_to_like:
-            status = self.twitter.like_tweet(id=tweet.id)
-            if status is not None:
-                users_to_save.append(tweet.author)
+            if not await self.like_scheduler.acquire():
+                break
+            status = await self.twitter.like_tweet(id=tweet.id)
+            if status is None:
+                self.like_scheduler.release()
+                continue
+            LIKES.labels('keyword').inc()
+            users_to_save.append(tweet.author)
 
         SLACK_INFO.send_message(f"5/5: Save {len(users_to_save)} users")
         self.save_new_users(users_to_save, num_likes=1)
+        PIPELINE_USERS.labels('keyword', 'saved').inc(len(users_to_save))
 
-        self.total_likes += len(users_to_save)
         SLACK_INFO.send_message(
             f'{len(users_to_save)}/{len(tweets)}tweets searched by keyword have been liked.'
         )
 
+    async def like_from_keywords(self, total_likes: int) -> None:
+        """Search keywords of TARGET_KEYWORD_AND_IMPORTANCE and like their tweets
+
+        Args:
+            total_likes: number of likes shared by keywords in proportion to their importance
+        """
+        random_keywords_and_importance: List[Tuple[str, int]] = random.sample(
+            TARGET_KEYWORD_AND_IMPORTANCE,
+            len(TARGET_KEYWORD_AND_IMPORTANCE)
+        )
+        like_num_by_keyword: Dict[str, int] = split_by_weights(
+            total_likes,
+            dict(random_keywords_and_importance)
+        )
+        # Keywords without likes are not searched, so their unread tweets are not marked read
+        plans: List[SearchPlan] = plan_searches([
+            keyword
+            for keyword, _ in random_keywords_and_importance
+            if like_num_by_keyword[keyword] > 0
+        ])
+        for plan in plans:
+            await asyncio.sleep(1)
+            tweets_by_keyword, watermarks = await self.search_tweets_of_plan(plan)
+            for keyword in plan.keywords:
+                await self.like_from_keyword(
+                    keyword,
+                    like_num_by_keyword[keyword],
+                    tweets_by_keyword[keyword]
+                )
+            with session_scope() as session:
+                save_watermarks(session, watermarks)
+
     @classmethod
     async def main(cls):
         """
 
         """
         cls_instance = cls()
+        if len(LIKED_TWEETS) == 0:
+            num_recorded = await cls_instance.twitter.backfill_liked_tweets()
+            SLACK_INFO.send_message(f'{num_recorded} liked tweets have been recorded in the ledger.')
         while True:
+            likes_by_pipeline: Dict[str, int] = cls_instance.like_scheduler.allocate()
+            if sum(likes_by_pipeline.values()) == 0:
+                wait_in_sec = min(cls_instance.like_scheduler.wait_time(), LIKE_BUDGET_RETRY_IN_SEC)
+                SLACK_INFO.send_message(
+                    f'Like budget of the last 24 hours has been used up. Wait {int(wait_in_sec)} seconds.'
+                )
+                await asyncio.sleep(wait_in_sec)
+                continue
             try:
-                cls_instance.like_tweet_from_users_in_db(data_num=DB_LIKES)
+                await cls_instance.like_tweet_from_users_in_db(
+                    data_num=min(DB_LIKES, likes_by_pipeline['db_users'])
+                )
             except TweepError as e:
                 SLACK_ERROR.send_message(
                     'An error occurred from tweepy client of like_tweet_from_users_in_db.'
@@ -200,34 +379,26 @@ class LikeLogic(LogicBase):
                 )
                 SLACK_ERROR.send_message(e.with_traceback(tb))
                 raise e
-            total_likes_by_keyword = int(LIKE_LIMIT_PER_DAY - cls_instance.total_likes)
-            random_keywords_and_importance: List[Tuple[str, int]] = random.sample(
-                TARGET_KEYWORD_AND_IMPORTANCE,
-                len(TARGET_KEYWORD_AND_IMPORTANCE)
-            )
-            for keyword, importance in random_keywords_and_importance:
-                await asyncio.sleep(1)
-                like_num = int(total_likes_by_keyword * importance / len(TARGET_KEYWORD_AND_IMPORTANCE))
-                try:
-                    cls_instance.like_from_keyword(keyword, like_num)
-                except TweepError as e:
-                    SLACK_ERROR.send_message(
-                        'An error occurred from tweepy client of like_from_keyword.'
-                        f'Reason for this error is「{e.reason}」'
-                    )
-                    raise e
-                except LogicError as e:
-                    SLACK_ERROR.send_message(
-                        'A LogicError occurred from like_from_keyword.'
-                        f'Reason for this error is「{e}」'
-                    )
-                    raise e
-                except Exception as e:
-                    # TODO: Narrow Exception by creating wrapper
-                    import sys
-                    tb = sys.exc_info()[2]
-                    SLACK_ERROR.send_message(
-                        'An error occurred from tweepy client of like_from_keyword.'
-                    )
-                    SLACK_ERROR.send_message(e.with_traceback(tb))
-                    raise e
+            try:
+                await cls_instance.like_from_keywords(likes_by_pipeline['keyword'])
+            except TweepError as e:
+                SLACK_ERROR.send_message(
+                    'An error occurred from tweepy client of like_from_keyword.'
+                    f'Reason for this error is「{e.reason}」'
+                )
+                raise e
+            except LogicError as e:
+                SLACK_ERROR.send_message(
+                    'A LogicError occurred from like_from_keyword.'
+                    f'Reason for this error is「{e}」'
+                )
+                raise e
+            except Exception as e:
+                # TODO: Narrow Exception by creating wrapper
+                import sys
+                tb = sys.exc_info()[2]
+                SLACK_ERROR.send_message(
+                    'An error occurred from tweepy client of like_from_keyword.'
+                )
+                SLACK_ERROR.send_message(e.with_traceback(tb))
+                raise e
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timedelta
+import time
+from typing import Dict
+
+from clients.rate_limit import RATE_LIMITS, FAVORITES_CREATE
+from models.liked_tweets import count_likes_since, fetch_oldest_like_since
+from utils.functions import split_by_weights
+from utils import (
+    session_scope,
+    LIKE_LIMIT_PER_DAY,
+    LIKE_BURST,
+    LIKE_PIPELINE_WEIGHTS,
+)
+
+
+class LikeScheduler:
+    """Daily like budget shared by the like pipelines
+
+    Notes:
+        Likes in the last 24 hours are counted from liked_tweets, so the budget is
+        correct after restarts and is shared by every process using the same db.
+        Slots are refilled every 24h / limit_per_day and up to burst slots can be saved,
+        so likes are spread over the day. While favorites/create is throttled
+        callers wait for its reset instead of sending requests that end in 429.
+        Slots are capped by the likes of the last burst intervals in liked_tweets before each like,
+        so a restart or another process does not get a fresh burst.
+        A slot taken for a like that was not made is given back by release.
+    """
+
+    def __init__(
+            self,
+            limit_per_day: int = LIKE_LIMIT_PER_DAY,
+            burst: int = LIKE_BURST,
+            weights: Dict[str, int] = LIKE_PIPELINE_WEIGHTS
+    ):
+        self.limit_per_day = limit_per_day
+        self._interval_in_sec = 24 * 60 * 60 / limit_per_day
+        self._burst = burst
+        self._weights = weights
+        self._slots = float(burst)
+        self._refilled_at = time.time()
+
+    def _slots_in_ledger(self) -> float:
+        """Slots left after the likes of every process in the last burst intervals"""
+        window_in_sec = self._interval_in_sec * self._burst
+        with session_scope() as session:
+            num_likes = count_likes_since(session, datetime.now() - timedelta(seconds=window_in_sec))
+        return float(max(0, self._burst - num_likes))
+
+    def count_recent_likes(self) -> int:
+        with session_scope() as session:
+            return count_likes_since(session, datetime.now() - timedelta(days=1))
+
+    def remaining(self) -> int:
+        """Number of likes left in the rolling 24 hours"""
+        return max(0, self.limit_per_day - self.count_recent_likes())
+
+    def allocate(self) -> Dict[str, int]:
+        """Shares of the remaining budget per pipeline
+
+        Returns:
+            pipeline -> number of likes. Every pipeline with weight > 0 gets at least 1 while budget is left,
+            so small remainders are not rounded down to 0 for every pipeline. acquire keeps the total in budget.
+        """
+        return split_by_weights(self.remaining(), self._weights, at_least_one=True)
+
+    def wait_time(self) -> float:
+        """Seconds until the next like can be made
+
+        Notes:
+            If the budget of the rolling 24 hours has been used up, this is when the oldest like in it expires.
+        """
+        day_ago = datetime.now() - timedelta(days=1)
+        if self.remaining() == 0:
+            with session_scope() as session:
+                oldest_liked_at = fetch_oldest_like_since(session, day_ago)
+            if oldest_liked_at is not None:
+                return max(1.0, (oldest_liked_at - day_ago).total_seconds())
+        slots = min(
+            self._burst,
+            self._slots + (time.time() - self._refilled_at) / self._interval_in_sec,
+            self._slots_in_ledger()
+        )
+        return max(0.0, (1 - slots) * self._interval_in_sec, RATE_LIMITS.wait_time(FAVORITES_CREATE))
+
+    async def acquire(self) -> bool:
+        """Wait for the next like slot
+
+        Returns:
+            False if the budget of the rolling 24 hours has been used up
+        """
+        if self.remaining() == 0:
+            return False
+        while True:
+            now = time.time()
+            self._slots = min(
+                self._burst,
+                self._slots + (now - self._refilled_at) / self._interval_in_sec,
+                self._slots_in_ledger()
+            )
+            self._refilled_at = now
+            wait_in_sec = max(
+                (1 - self._slots) * self._interval_in_sec,
+                RATE_LIMITS.wait_time(FAVORITES_CREATE)
+            )
+            if wait_in_sec <= 0:
+                self._slots -= 1
+                return True
+            await asyncio.sleep(wait_in_sec)
+
+    def release(self) -> None:
+        """Give back the slot of a like that was not made"""
+        self._slots = min(float(self._burst), self._slots + 1)
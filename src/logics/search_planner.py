@@ -0,0 +1,142 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Pattern
+from urllib.parse import quote
+
+from models.search_watermarks import Watermark
+from utils.settings import SEARCH_QUERY_MAX_LENGTH, SEARCH_KEYWORDS_PER_PLAN
+
+
+class SearchPlan(NamedTuple):
+    """A search query that covers several keywords"""
+    query: str
+    keywords: List[str]
+
+
+def build_query(keywords: List[str]) -> str:
+    """Combine keywords into one OR query
+
+    Examples:
+        >>> build_query(['python', 'web アプリ'])
+        'python OR "web アプリ"'
+    """
+    return ' OR '.join(
+        f'"{keyword}"' if ' ' in keyword else keyword
+        for keyword in keywords
+    )
+
+
+def plan_searches(
+        keywords: List[str],
+        max_query_length: int = SEARCH_QUERY_MAX_LENGTH,
+        max_keywords: int = SEARCH_KEYWORDS_PER_PLAN
+) -> List[SearchPlan]:
+    """Pack keywords into as few OR queries as possible
+
+    Args:
+        keywords: keywords to search. Their order is kept.
+        max_query_length: limit of the URL encoded query
+        max_keywords: max number of keywords per query
+
+    Notes:
+        The limit of search/tweets is 500 characters after URL encoding,
+        and a Japanese character takes 9 of them.
+        Keywords of a query share its result pages, so max_keywords keeps the number of tweets per keyword.
+    """
+    plans: List[SearchPlan] = []
+    current: List[str] = []
+    for keyword in keywords:
+        candidate = current + [keyword]
+        if current and (len(candidate) > max_keywords or len(quote(build_query(candidate))) > max_query_length):
+            plans.append(SearchPlan(build_query(current), current))
+            candidate = [keyword]
+        current = candidate
+    if current:
+        plans.append(SearchPlan(build_query(current), current))
+    return plans
+
+
+def demultiplex(tweets, keywords: List[str]) -> Dict[str, list]:
+    """Assign tweets of a combined query back to the keywords they match
+
+    Args:
+        tweets: result of the query of keywords
+        keywords: keywords of the query
+
+    Returns:
+        keyword -> tweets. A tweet goes to the first keyword found in its full_text by keyword_pattern.
+        Tweets that match no keyword(e.g. matched by user name) are dropped.
+
+    Notes:
+        tweets have to be fetched with tweet_mode='extended'. text is cut at 140 characters.
+    """
+    tweets_by_keyword: Dict[str, list] = {keyword: [] for keyword in keywords}
+    patterns = [(keyword, keyword_pattern(keyword)) for keyword in keywords]
+    for tweet in tweets:
+        for keyword, pattern in patterns:
+            if pattern.search(tweet.full_text):
+                tweets_by_keyword[keyword].append(tweet)
+                break
+    return tweets_by_keyword
+
+
+def keyword_pattern(keyword: str) -> Pattern:
+    """Case insensitive pattern that finds keyword as a token of a tweet
+
+    Notes:
+        An edge of keyword that is an ascii letter or digit must not touch another one, so 'AI' does not match 'email'.
+        A hashtag must not continue after keyword. Japanese has no word boundaries, so it is matched as it is.
+
+    Examples:
+        >>> bool(keyword_pattern('AI').search('AIエンジニア')), bool(keyword_pattern('AI').search('said'))
+        (True, False)
+    """
+    pattern = re.escape(keyword)
+    if re.match(r'[0-9A-Za-z]', keyword[0]):
+        pattern = r'(?<![0-9A-Za-z])' + pattern
+    if keyword.startswith('#'):
+        pattern += r'(?!\w)'
+    elif re.match(r'[0-9A-Za-z]', keyword[-1]):
+        pattern += r'(?![0-9A-Za-z])'
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def advance_watermark(
+        watermark: Optional[Watermark],
+        walk_max_id: Optional[int],
+        walk_since_id: int,
+        newest_id: Optional[int]
+) -> Optional[Watermark]:
+    """Watermark of a keyword after a search read every tweet in (walk_since_id, walk_max_id]
+
+    Args:
+        watermark: watermark before the search. None if the keyword has never been searched.
+        walk_max_id: max_id of the first page. None if the search started from the newest tweet.
+        walk_since_id: since_id of the query if the last page came back short or empty,
+            otherwise the id just below the oldest tweet fetched
+        newest_id: id of the newest tweet fetched. None if nothing was fetched.
+
+    Returns:
+        watermark to save. None if there is nothing to save.
+
+    Notes:
+        Tweets between the watermark and the oldest page fetched are kept as a gap,
+        so the next searches walk down into it instead of skipping it.
+        The first search of a keyword starts from its newest tweet, as older tweets were never wanted.
+        A watermark is returned unchanged when the search would split its unread tweets into two gaps.
+    """
+    if watermark is None:
+        return Watermark(newest_id) if newest_id is not None else None
+    newest_read = watermark.newest_id if watermark.has_gap else watermark.since_id
+    if walk_max_id is None:
+        newest_read = max(newest_read, newest_id or newest_read)
+        if not watermark.has_gap:
+            if walk_since_id <= watermark.since_id:
+                return Watermark(newest_read)
+            return Watermark(watermark.since_id, walk_since_id, newest_read)
+        if walk_since_id > watermark.newest_id:
+            return watermark
+    elif not watermark.has_gap or walk_max_id < watermark.gap_max_id:
+        return watermark
+    if walk_since_id <= watermark.since_id:
+        return Watermark(newest_read)
+    return Watermark(watermark.since_id, min(watermark.gap_max_id, walk_since_id), newest_read)
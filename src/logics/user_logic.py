@@ -1,17 +1,19 @@
-import asyncio
 import os
 from dataclasses import dataclass
-from typing import Set, List
+from typing import List
 
 from tweepy.models import User as user_account
 from tweepy.error import TweepError
 
+from models import HarvestCheckpoints
 from clients import (
     SLACK_INFO,
     SLACK_WARNING,
     SLACK_ERROR,
 )
-from utils.functions import parse_target_users
+from utils.database import session_scope
+from utils.functions import chunked, parse_target_users
+from utils.metrics import PIPELINE_USERS
 from utils.settings import DUMPED_FILE, NUM_PER_BATCH
 from .base import LogicBase
 from .errors import LogicErrorFileNotFound, LogicError
@@ -20,57 +22,160 @@ from .errors import LogicErrorFileNotFound, LogicError
 @dataclass
 class UserLogic(LogicBase):
 
-    def collect_followers_of_famous_users(self, famous_guys: List[str]) -> List[List[int]]:
-        """collect_followers_of_famous_users_and_save_them_in_db
+    def load_checkpoint(self, famous_guy: str) -> HarvestCheckpoints:
+        """Return the checkpoint of famous_guy. It is created if it does not exist.
 
+        Args:
+            famous_guy: target celebrity
         """
-        SLACK_INFO.send_message('[save_user]1/4: Fetch all_ids')
-        all_ids: Set[int] = {
-            id_
-            for famous_guy in famous_guys
-            for id_ in self.twitter.fetch_user_follower_ids(famous_guy)
-        }
+        with session_scope() as session:
+            checkpoint = session.query(HarvestCheckpoints).filter(
+                HarvestCheckpoints.target == famous_guy).first()
+            if checkpoint is None:
+                checkpoint = HarvestCheckpoints(
+                    target=famous_guy,
+                    next_cursor=-1,
+                    pending_ids=[],
+                    last_completed_batch=-1,
+                    is_completed=False
+                )
+                session.add(checkpoint)
+                session.flush()
+                session.refresh(checkpoint)
+        return checkpoint
 
-        SLACK_INFO.send_message(
-            f'[save_user]2/4: filter to avoid saving duplicate id. all_ids:{len(all_ids)}'
-        )
-        users_filtered_if_existed: List[int] = self.filter_by_existence_in_database(all_ids)
+    def mark_dumped_users_completed(self, dumped_file: str) -> None:
+        """Import targets finished before checkpoints existed
 
-        SLACK_INFO.send_message(
-            f'[save_user]3/5: Divide users_filtered_if_existed by {NUM_PER_BATCH}. '
+        Args:
+            dumped_file: file that has a finished target per line
+        """
+        if not os.path.exists(dumped_file):
+            return
+        for famous_guy in parse_target_users(dumped_file):
+            checkpoint = self.load_checkpoint(famous_guy)
+            if not checkpoint.is_completed:
+                self.update_db(
+                    HarvestCheckpoints,
+                    search_key='target',
+                    target=famous_guy,
+                    next_cursor=0,
+                    is_completed=True
+                )
+
+    async def save_pending_batches(
+            self,
+            famous_guy: str,
+            pending_ids: List[int],
+            last_completed_batch: int
+    ) -> None:
+        """Evaluate batches of pending_ids after last_completed_batch and record each of them
+
+        Args:
+            famous_guy: target celebrity
+            pending_ids: new follower ids of the current page
+            last_completed_batch: index of the last batch that has already been saved
+        """
+        for idx, user_batch in enumerate(chunked(pending_ids, NUM_PER_BATCH)):
+            if idx <= last_completed_batch:
+                continue
+            await self.save_batches(user_batch)
+            self.update_db(
+                HarvestCheckpoints,
+                search_key='target',
+                target=famous_guy,
+                last_completed_batch=idx
+            )
+
+    async def harvest_followers(self, famous_guy: str) -> None:
+        """Evaluate and save followers of famous_guy page by page
+
+        Args:
+            famous_guy: target celebrity
+
+        Notes:
+            Each page of followers/ids is filtered, divided into batches and evaluated
+            before the next page is fetched, so memory does not grow with the number of followers.
+            The cursor and the last saved batch are stored in harvest_checkpoints,
+            so a restart resumes from the batch where it stopped without fetching pages again.
+            The checkpoint is completed only after twitter returned next_cursor 0.
+            If a page fails, TweepError is raised and the cursor of the last good page is kept.
+        """
+        checkpoint = self.load_checkpoint(famous_guy)
+        if checkpoint.pending_ids:
+            SLACK_INFO.send_message(
+                f'[save_user]Resume {famous_guy} from batch {checkpoint.last_completed_batch + 1}'
+            )
+        await self.save_pending_batches(
+            famous_guy,
+            checkpoint.pending_ids or [],
+            checkpoint.last_completed_batch
         )
-        user_batches: List[List[int]] = [
-            users_filtered_if_existed[idx:idx + NUM_PER_BATCH]
-            for idx in range(0, len(users_filtered_if_existed), NUM_PER_BATCH)
-        ]
 
-        SLACK_INFO.send_message(
-            f'[save_user]total batch number is {len(user_batches)}'
+        num_pages = 0
+        next_cursor = checkpoint.next_cursor
+        async for ids, next_cursor in self.twitter.iter_user_follower_id_pages(
+                famous_guy,
+                cursor=checkpoint.next_cursor
+        ):
+            num_pages += 1
+            users_filtered_if_existed: List[int] = self.filter_by_existence_in_database(ids)
+            SLACK_INFO.send_message(
+                f'[save_user]page {num_pages}: {len(users_filtered_if_existed)}/{len(ids)} ids are new. '
+                f'Divide them by {NUM_PER_BATCH}.'
+            )
+            self.update_db(
+                HarvestCheckpoints,
+                search_key='target',
+                target=famous_guy,
+                next_cursor=next_cursor,
+                pending_ids=users_filtered_if_existed,
+                last_completed_batch=-1
+            )
+            await self.save_pending_batches(famous_guy, users_filtered_if_existed, -1)
+
+        if next_cursor != 0:
+            return
+        self.update_db(
+            HarvestCheckpoints,
+            search_key='target',
+            target=famous_guy,
+            next_cursor=0,
+            pending_ids=[],
+            is_completed=True
         )
-        return user_batches
 
-    def save_batches(self, user_batch):
+    async def save_batches(self, user_batch: List[int]):
+        """Evaluate users in user_batch and save valuable ones
+
+        Args:
+            user_batch: at most NUM_PER_BATCH user ids. Their profiles are fetched by one users/lookup request.
+        """
         SLACK_INFO.send_message(
             f'[save_user]4/5: filter based on their values. '
         )
+        users: List[user_account] = await self.twitter.fetch_users_info(user_batch)
+        # Profiles are checked at once first so that timelines are fetched only for candidates
+        is_candidate = self.evaluate.evaluate_users(users)
+        evaluations = await self.evaluate_users_concurrently([
+            user for user, is_candidate_user in zip(users, is_candidate)
+            if is_candidate_user
+        ])
         users_filtered_by_value: List[user_account] = [
-            self.evaluate.user_info_cache for id_ in user_batch
-            if self.evaluate.is_valuable_user(id_)
+            evaluation.user for evaluation in evaluations
+            if evaluation.verdict
         ]
 
         SLACK_INFO.send_message(
             f'[save_user]Save all of them. users_filtered_by_value{len(users_filtered_by_value)}'
         )
         self.save_new_users(users_filtered_by_value)
+        PIPELINE_USERS.labels('harvest', 'evaluated').inc(len(users))
+        PIPELINE_USERS.labels('harvest', 'saved').inc(len(users_filtered_by_value))
 
-    @classmethod
-    async def main(cls, *args, **kwargs) -> None:
-        """
-
-        """
-        target_dir = kwargs.get('target_dir', None)
-        if target_dir is None:
-            raise LogicErrorFileNotFound('target_file has to be specified in main of UserLogic')
+    @staticmethod
+    def load_famous_guys(target_dir: str) -> List[str]:
+        """Targets listed in the files of target_dir"""
         files: List[str] = os.listdir(target_dir)
         print(f'files{files}')
         famous_guys = [
@@ -79,25 +184,36 @@ class UserLogic(LogicBase):
             for user in parse_target_users(os.path.join(target_dir, file))
         ]
         print(f'famous_guys{famous_guys}')
-        dumped_list: List[str] = parse_target_users(DUMPED_FILE)
+        return famous_guys
+
+    @classmethod
+    async def main(cls, *args, **kwargs) -> None:
+        """
 
+        """
+        target_dir = kwargs.get('target_dir', None)
+        if target_dir is None:
+            raise LogicErrorFileNotFound('target_file has to be specified in main of UserLogic')
+        famous_guys = cls.load_famous_guys(target_dir)
         cls_instance = cls()
+        cls_instance.mark_dumped_users_completed(DUMPED_FILE)
 
         for famous_guy in famous_guys:
-            if famous_guy in dumped_list:
+            if cls_instance.load_checkpoint(famous_guy).is_completed:
                 SLACK_WARNING.send_message(f'this guy {famous_guy} has already been used. Skip him.')
                 continue
             SLACK_INFO.send_message(f'TwitterBot-chan will collect followers of「{famous_guy}」')
             try:
-                user_batches = cls_instance.collect_followers_of_famous_users([famous_guy])
+                await cls_instance.harvest_followers(famous_guy)
             except TweepError as e:
+                # The checkpoint keeps the last good cursor, so the next run resumes this target
                 SLACK_ERROR.send_message(
-                    'An error occurred from tweepy client in UserLogic.'
+                    f'An error occurred from tweepy client in UserLogic. {famous_guy} is resumed on the next run.'
                     f'error code is「{e.api_code}」'
                     f'error message is「{e.reason}」'
                     f'error response is「{e.response}」'
                 )
-                raise e
+                continue
             except LogicError as e:
                 SLACK_ERROR.send_message(
                     'An error occurred in UserLogic.'
@@ -113,9 +229,4 @@ class UserLogic(LogicBase):
                 )
                 SLACK_ERROR.send_message(e.with_traceback(tb))
                 raise e
-            for user_batch in user_batches:
-                cls_instance.save_batches(user_batch)
-                await asyncio.sleep(1)
-            with open(DUMPED_FILE, mode='a') as f:
-                f.write(f'{famous_guy}\n')
         SLACK_INFO.send_message('****[IMPORTANT]The whole process of registering users ended!*****')
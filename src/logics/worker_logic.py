@@ -0,0 +1,288 @@
+import asyncio
+from dataclasses import dataclass, field
+from datetime import date, datetime
+import os
+import socket
+from typing import Any, Dict, List, Set
+
+from sqlalchemy import and_
+
+from models import HarvestCheckpoints
+from models.jobs import (
+    HARVEST_PAGE,
+    EVALUATE_BATCH,
+    LIKE_CANDIDATE,
+    KEYWORD_LIKES,
+    claim_exclusive_job,
+    claim_jobs,
+    complete_job,
+    count_jobs_by_status,
+    enqueue_jobs,
+    extend_leases,
+    fail_job,
+    has_unfinished_jobs,
+)
+from clients import (
+    SLACK_INFO,
+    SLACK_ERROR,
+)
+from utils.database import session_scope
+from utils.functions import LazyAttribute, chunked
+from utils.metrics import JOBS, register_stats
+from utils.settings import (
+    DB_LIKES,
+    DUMPED_FILE,
+    LIKE_BUDGET_RETRY_IN_SEC,
+    NUM_PER_BATCH,
+    JOB_LEASE_IN_SEC,
+    JOB_HEARTBEAT_INTERVAL_IN_SEC,
+    JOB_MAX_ATTEMPTS,
+    JOB_CLAIM_BATCH,
+    JOB_POLL_INTERVAL_IN_SEC,
+)
+from .base import LogicBase
+from .like_logic import LikeLogic
+from .user_logic import UserLogic
+from .errors import LogicErrorFileNotFound
+
+
+# Jobs that like tweets. Only one of them runs at a time across all workers.
+LIKE_JOB_TYPES = [LIKE_CANDIDATE, KEYWORD_LIKES]
+
+
+def default_worker_id() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def job_stats() -> Dict[str, Dict[str, int]]:
+    """Number of jobs per status in the queue"""
+    with session_scope() as session:
+        return {
+            status: {'count': count}
+            for status, count in count_jobs_by_status(session).items()
+        }
+
+
+@dataclass
+class WorkerLogic(LogicBase):
+    """Run harvesting and likes as jobs of the queue in db
+
+    Notes:
+        Every container runs a worker and they split the jobs with SELECT ... FOR UPDATE SKIP LOCKED.
+        A page of followers/ids is a harvest_page job. It enqueues an evaluate_batch job per
+        NUM_PER_BATCH new ids and the harvest_page job of the next cursor.
+        When no like job is left, the like budget of LikeLogic.main is enqueued again as
+        like_candidate jobs of users in db and a keyword_likes job that searches keywords.
+        Only one like job runs at a time across all workers, so the like budget checked
+        against liked_tweets before each like cannot be passed by likes in flight.
+        Like jobs run in their own task because a like can wait minutes for its slot.
+        Follow-up jobs have dedupe keys, so running a job again after a worker died does not duplicate work.
+    """
+    worker_id: str = field(default_factory=default_worker_id)
+    running_job_ids: Set[int] = field(default_factory=set)
+    user_logic = LazyAttribute(UserLogic)
+    like_logic = LazyAttribute(LikeLogic)
+
+    def enqueue_targets(self, famous_guys: List[str]) -> None:
+        """Enqueue the next page of every target that has not been completed
+
+        Args:
+            famous_guys: target celebrities
+        """
+        jobs: List[Dict[str, Any]] = []
+        for famous_guy in famous_guys:
+            checkpoint = self.user_logic.load_checkpoint(famous_guy)
+            if checkpoint.is_completed:
+                continue
+            # Batches left by UserLogic.main before the queue was used
+            for idx, user_batch in enumerate(chunked(checkpoint.pending_ids or [], NUM_PER_BATCH)):
+                if idx <= checkpoint.last_completed_batch:
+                    continue
+                jobs.append({
+                    'job_type': EVALUATE_BATCH,
+                    'payload': {'user_ids': user_batch},
+                    'dedupe_key': f'{EVALUATE_BATCH}:{famous_guy}:pending:{idx}',
+                })
+            if checkpoint.next_cursor != 0:
+                jobs.append(self.harvest_page_job(famous_guy, checkpoint.next_cursor))
+        with session_scope() as session:
+            enqueue_jobs(session, jobs, JOB_MAX_ATTEMPTS)
+            # Targets whose last page was fetched by UserLogic.main. Their pending batches are in the queue now.
+            session.query(HarvestCheckpoints).filter(and_(
+                HarvestCheckpoints.target.in_(famous_guys),
+                HarvestCheckpoints.next_cursor == 0,
+            )).update({
+                HarvestCheckpoints.pending_ids: [],
+                HarvestCheckpoints.is_completed: True,
+            }, synchronize_session=False)
+
+    def enqueue_likes(self) -> None:
+        """Enqueue like jobs of one cycle of LikeLogic.main unless like jobs are left"""
+        with session_scope() as session:
+            if has_unfinished_jobs(session, LIKE_JOB_TYPES):
+                return
+        likes_by_pipeline = self.like_logic.like_scheduler.allocate()
+        self.enqueue_like_candidates(min(DB_LIKES, likes_by_pipeline['db_users']))
+        if likes_by_pipeline['keyword'] == 0:
+            return
+        with session_scope() as session:
+            enqueue_jobs(session, [{
+                'job_type': KEYWORD_LIKES,
+                'payload': {'num_likes': likes_by_pipeline['keyword']},
+                # Idle workers that enqueue at the same time add one job
+                'dedupe_key': f'{KEYWORD_LIKES}:{datetime.now():%Y-%m-%dT%H:%M}',
+            }], JOB_MAX_ATTEMPTS)
+
+    def enqueue_like_candidates(self, num_users: int) -> int:
+        """Enqueue users in db that should be liked next
+
+        Returns:
+            number of users picked
+        """
+        if num_users == 0:
+            return 0
+        users = self.like_logic.fetch_users_with_likes_less_than_threshold_from_db(data_num=num_users)
+        if len(users) == 0:
+            return 0
+        self.like_logic.mark_users_checked_in_db([user.user_id for user in users])
+        today = date.today().isoformat()
+        with session_scope() as session:
+            enqueue_jobs(session, [
+                {
+                    'job_type': LIKE_CANDIDATE,
+                    'payload': {'user_id': user.user_id},
+                    'dedupe_key': f'{LIKE_CANDIDATE}:{user.user_id}:{today}',
+                }
+                for user in users
+            ], JOB_MAX_ATTEMPTS)
+        return len(users)
+
+    @staticmethod
+    def harvest_page_job(famous_guy: str, cursor: int) -> Dict[str, Any]:
+        return {
+            'job_type': HARVEST_PAGE,
+            'payload': {'target': famous_guy, 'cursor': cursor},
+            'dedupe_key': f'{HARVEST_PAGE}:{famous_guy}:{cursor}',
+        }
+
+    async def harvest_page(self, payload: Dict[str, Any]) -> None:
+        """Fetch a page of followers and enqueue its batches and the next page
+
+        Notes:
+            A page that cannot be fetched raises, so the job goes back to the queue with its cursor.
+        """
+        famous_guy, cursor = payload['target'], payload['cursor']
+        ids, next_cursor = await self.twitter.fetch_user_follower_ids_page(famous_guy, cursor)
+        new_ids: List[int] = self.filter_by_existence_in_database(ids)
+        jobs: List[Dict[str, Any]] = [
+            {
+                'job_type': EVALUATE_BATCH,
+                'payload': {'user_ids': user_batch},
+                'dedupe_key': f'{EVALUATE_BATCH}:{famous_guy}:{cursor}:{idx}',
+            }
+            for idx, user_batch in enumerate(chunked(new_ids, NUM_PER_BATCH))
+        ]
+        if next_cursor != 0:
+            jobs.append(self.harvest_page_job(famous_guy, next_cursor))
+
+        with session_scope() as session:
+            enqueue_jobs(session, jobs, JOB_MAX_ATTEMPTS)
+            session.query(HarvestCheckpoints).filter(and_(
+                HarvestCheckpoints.target == famous_guy,
+                HarvestCheckpoints.is_completed.is_(False),
+            )).update({
+                HarvestCheckpoints.next_cursor: next_cursor,
+                HarvestCheckpoints.pending_ids: [],
+                HarvestCheckpoints.is_completed: next_cursor == 0,
+            }, synchronize_session=False)
+        SLACK_INFO.send_message(
+            f'[worker]{famous_guy}: {len(new_ids)}/{len(ids)} ids are new. {len(jobs)} jobs have been enqueued.'
+        )
+
+    async def evaluate_batch(self, payload: Dict[str, Any]) -> None:
+        await self.user_logic.save_batches(payload['user_ids'])
+
+    async def like_candidate(self, payload: Dict[str, Any]) -> None:
+        await self.like_logic.like_user_in_db(payload['user_id'])
+
+    async def keyword_likes(self, payload: Dict[str, Any]) -> None:
+        await self.like_logic.like_from_keywords(payload['num_likes'])
+
+    async def run_job(self, job: Dict[str, Any]) -> None:
+        """Run a claimed job and record its result
+
+        Notes:
+            A failed job goes back to the queue until it has been tried JOB_MAX_ATTEMPTS times.
+        """
+        handlers = {
+            HARVEST_PAGE: self.harvest_page,
+            EVALUATE_BATCH: self.evaluate_batch,
+            LIKE_CANDIDATE: self.like_candidate,
+            KEYWORD_LIKES: self.keyword_likes,
+        }
+        self.running_job_ids.add(job['id'])
+        try:
+            await handlers[job['job_type']](job['payload'])
+        except Exception as e:
+            SLACK_ERROR.send_message(
+                f'[worker]Job {job["id"]}({job["job_type"]}) failed on attempt {job["attempts"]}. Reason is「{e!r}」'
+            )
+            with session_scope() as session:
+                fail_job(session, self.worker_id, job['id'], repr(e))
+            JOBS.labels(job['job_type'], 'failed').inc()
+        else:
+            with session_scope() as session:
+                complete_job(session, self.worker_id, job['id'])
+            JOBS.labels(job['job_type'], 'done').inc()
+        finally:
+            self.running_job_ids.discard(job['id'])
+
+    async def heartbeat(self) -> None:
+        """Extend the leases of running jobs so that other workers do not take them over"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL_IN_SEC)
+            with session_scope() as session:
+                extend_leases(session, self.worker_id, list(self.running_job_ids), JOB_LEASE_IN_SEC)
+
+    async def work(self) -> None:
+        """Claim and run harvesting jobs until the process stops"""
+        while True:
+            with session_scope() as session:
+                jobs = claim_jobs(
+                    session, self.worker_id, [HARVEST_PAGE, EVALUATE_BATCH], JOB_CLAIM_BATCH, JOB_LEASE_IN_SEC
+                )
+            if jobs:
+                await asyncio.gather(*(self.run_job(job) for job in jobs))
+                continue
+            await asyncio.sleep(JOB_POLL_INTERVAL_IN_SEC)
+
+    async def like_worker(self) -> None:
+        """Claim and run like jobs one at a time until the process stops"""
+        like_scheduler = self.like_logic.like_scheduler
+        while True:
+            if like_scheduler.remaining() == 0:
+                await asyncio.sleep(min(like_scheduler.wait_time(), LIKE_BUDGET_RETRY_IN_SEC))
+                continue
+            with session_scope() as session:
+                jobs = claim_exclusive_job(session, self.worker_id, LIKE_JOB_TYPES, JOB_LEASE_IN_SEC)
+            if jobs:
+                await self.run_job(jobs[0])
+                continue
+            self.enqueue_likes()
+            await asyncio.sleep(JOB_POLL_INTERVAL_IN_SEC)
+
+    @classmethod
+    async def main(cls, *args, **kwargs) -> None:
+        target_dir = kwargs.get('target_dir', None)
+        if target_dir is None:
+            raise LogicErrorFileNotFound('target_file has to be specified in main of WorkerLogic')
+        cls_instance = cls()
+        register_stats('job_queue', job_stats, labels=('status',))
+        cls_instance.user_logic.mark_dumped_users_completed(DUMPED_FILE)
+        cls_instance.enqueue_targets(UserLogic.load_famous_guys(target_dir))
+        SLACK_INFO.send_message(f'[worker]{cls_instance.worker_id} starts taking jobs.')
+        await asyncio.gather(
+            cls_instance.heartbeat(),
+            cls_instance.work(),
+            cls_instance.like_worker(),
+        )
@@ -1,19 +1,53 @@
 import asyncio
+import signal
+import sys
+from typing import Dict
 
+from clients import RATE_LIMITS, SLACK_INFO
 from logics import (
     UserLogic,
     LikeLogic,
+    WorkerLogic,
 )
 from models.users import create_table_unless_exists
+from utils import RATE_LIMIT_REPORT_INTERVAL_IN_SEC, METRICS_PORT, USE_JOB_QUEUE
+from utils.metrics import start_metrics_server
+
+
+async def report_rate_limits():
+    """Post endpoints that are throttled or have been waited for"""
+    while True:
+        await asyncio.sleep(RATE_LIMIT_REPORT_INTERVAL_IN_SEC)
+        remaining_by_endpoint: Dict[str, int] = {}
+        for (_, endpoint), quota in RATE_LIMITS.stats().items():
+            remaining_by_endpoint[endpoint] = remaining_by_endpoint.get(endpoint, 0) + quota['remaining']
+        lines = [
+            f"{endpoint}: remaining {remaining_by_endpoint.get(endpoint, 0)} on all credentials, "
+            f"waiters {stats['waiters']}, waited {int(stats['throttled_seconds'])}s in total"
+            for endpoint, stats in RATE_LIMITS.throttle_stats().items()
+        ]
+        if lines:
+            SLACK_INFO.send_message('Rate limits\n' + '\n'.join(lines))
 
 
 def main():
+    # Exit normally on docker stop so that buffers are flushed by atexit
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     create_table_unless_exists()
+    start_metrics_server(METRICS_PORT)
     loop = asyncio.get_event_loop()
-    gather = asyncio.gather(
-        LikeLogic.main(),
-        UserLogic.main(target_dir='./target_lists'),
-    )
+    if USE_JOB_QUEUE:
+        # Harvesting and both like pipelines run as jobs. Every container runs the same worker.
+        gather = asyncio.gather(
+            WorkerLogic.main(target_dir='./target_lists'),
+            report_rate_limits(),
+        )
+    else:
+        gather = asyncio.gather(
+            LikeLogic.main(),
+            UserLogic.main(target_dir='./target_lists'),
+            report_rate_limits(),
+        )
     loop.run_until_complete(gather)
 
 
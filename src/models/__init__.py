@@ -1,5 +1,13 @@
 from .users import ValuableUsers
+from .checkpoints import HarvestCheckpoints
+from .search_watermarks import SearchWatermarks
+from .liked_tweets import LikedTweets
+from .jobs import Jobs
 
 __all__ = [
-    'ValuableUsers'
+    'ValuableUsers',
+    'HarvestCheckpoints',
+    'SearchWatermarks',
+    'LikedTweets',
+    'Jobs',
 ]
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from sqlalchemy import Column, BigInteger, Boolean, DateTime, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from utils import Base
+
+
+class HarvestCheckpoints(Base):
+    """Progress of collecting followers of a target account
+
+    Notes:
+        pending_ids: new follower ids of the page being evaluated
+        next_cursor: cursor of followers/ids for the page after pending_ids. 0 means no more pages.
+        last_completed_batch: index of the last batch of pending_ids that has been saved. -1 means none.
+    """
+
+    __tablename__ = 'harvest_checkpoints'
+    target = Column('target', String, primary_key=True)
+    next_cursor = Column('next_cursor', BigInteger, default=-1)
+    pending_ids = Column('pending_ids', ARRAY(BigInteger), default=list)
+    last_completed_batch = Column('last_completed_batch', Integer, default=-1)
+    is_completed = Column('is_completed', Boolean, default=False)
+    updated_at = Column('updated_at', DateTime, default=datetime.now, onupdate=datetime.now)
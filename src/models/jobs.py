@@ -0,0 +1,215 @@
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import Column, BigInteger, DateTime, Index, Integer, String, Text, and_, case, exists, func, or_, select
+from sqlalchemy.dialects.postgresql import JSONB, insert
+
+from utils import Base
+
+
+# Job types
+HARVEST_PAGE = 'harvest_page'
+EVALUATE_BATCH = 'evaluate_batch'
+LIKE_CANDIDATE = 'like_candidate'
+KEYWORD_LIKES = 'keyword_likes'
+
+# Job statuses
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Jobs(Base):
+    """Work shared by every bot process
+
+    Notes:
+        A running job whose lease has expired is treated as pending, so the work of
+        a worker that died is picked up by another one. Times are taken from db to
+        avoid the clock skew between containers.
+        dedupe_key keeps the same work from being enqueued twice by different workers.
+    """
+
+    __tablename__ = 'jobs'
+    id = Column('id', BigInteger, primary_key=True, autoincrement=True)
+    job_type = Column('job_type', String, nullable=False)
+    payload = Column('payload', JSONB, nullable=False)
+    dedupe_key = Column('dedupe_key', String, unique=True)
+    status = Column('status', String, nullable=False, default=PENDING)
+    attempts = Column('attempts', Integer, nullable=False, default=0)
+    max_attempts = Column('max_attempts', Integer, nullable=False)
+    locked_by = Column('locked_by', String)
+    lease_expires_at = Column('lease_expires_at', DateTime)
+    last_error = Column('last_error', Text)
+    created_at = Column('created_at', DateTime, server_default=func.now())
+    updated_at = Column('updated_at', DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index('ix_jobs_status_job_type_id', 'status', 'job_type', 'id'),
+    )
+
+
+def enqueue_jobs(session, jobs: List[Dict[str, Any]], max_attempts: int) -> None:
+    """Add jobs. Jobs whose dedupe_key already exists are skipped.
+
+    Args:
+        session: db session. Caller is responsible for commit.
+        jobs: dicts whose keys are job_type, payload and dedupe_key(None means no dedupe)
+        max_attempts: number of attempts before a job is marked as failed
+    """
+    if len(jobs) == 0:
+        return
+    statement = insert(Jobs.__table__).values([
+        {
+            'job_type': job['job_type'],
+            'payload': job['payload'],
+            'dedupe_key': job.get('dedupe_key'),
+            'status': PENDING,
+            'attempts': 0,
+            'max_attempts': max_attempts,
+        }
+        for job in jobs
+    ]).on_conflict_do_nothing(index_elements=['dedupe_key'])
+    session.execute(statement)
+
+
+def claim_jobs(
+        session,
+        worker_id: str,
+        job_types: Sequence[str],
+        limit: int,
+        lease_in_sec: float
+) -> List[Dict[str, Any]]:
+    """Lease up to limit jobs that no other worker holds
+
+    Args:
+        session: db session. Caller is responsible for commit.
+        worker_id: id of the worker that takes the jobs
+        job_types: types of jobs to take
+        limit: max number of jobs
+        lease_in_sec: jobs go back to the queue if the lease is not extended within this
+
+    Returns:
+        dicts of id, job_type, payload and attempts of the claimed jobs
+
+    Notes:
+        SELECT ... FOR UPDATE SKIP LOCKED lets workers claim at the same time
+        without waiting for each other or taking the same job.
+    """
+    table = Jobs.__table__
+    # Jobs of a worker that died on their last attempt
+    session.execute(table.update().where(and_(
+        table.c.status == RUNNING,
+        table.c.lease_expires_at < func.now(),
+        table.c.attempts >= table.c.max_attempts,
+    )).values(status=FAILED, last_error='lease expired', updated_at=func.now()))
+
+    claimable = table.select().with_only_columns([table.c.id]).where(and_(
+        table.c.job_type.in_(job_types),
+        table.c.attempts < table.c.max_attempts,
+        or_(
+            table.c.status == PENDING,
+            and_(table.c.status == RUNNING, table.c.lease_expires_at < func.now()),
+        ),
+    )).order_by(table.c.id).limit(limit).with_for_update(skip_locked=True)
+
+    statement = table.update().where(table.c.id.in_(claimable)).values(
+        status=RUNNING,
+        locked_by=worker_id,
+        lease_expires_at=func.now() + timedelta(seconds=lease_in_sec),
+        attempts=table.c.attempts + 1,
+        updated_at=func.now(),
+    ).returning(table.c.id, table.c.job_type, table.c.payload, table.c.attempts)
+    return [dict(row) for row in session.execute(statement)]
+
+
+def claim_exclusive_job(
+        session,
+        worker_id: str,
+        job_types: Sequence[str],
+        lease_in_sec: float
+) -> List[Dict[str, Any]]:
+    """Lease a job of job_types unless a job of job_types is running on any worker
+
+    Args:
+        session: db session. Caller is responsible for commit.
+        worker_id: id of the worker that takes the job
+        job_types: types of jobs that never run at the same time
+        lease_in_sec: the job goes back to the queue if the lease is not extended within this
+
+    Returns:
+        the claimed job in a list. Empty if none is pending or one is running.
+
+    Notes:
+        Claimers of job_types are serialized by a transaction level advisory lock,
+        so two workers cannot both see no running job and claim one each.
+    """
+    lock_key = ','.join(sorted(job_types))
+    session.execute(select([func.pg_advisory_xact_lock(func.hashtext(lock_key))]))
+    table = Jobs.__table__
+    is_running = session.execute(select([exists().where(and_(
+        table.c.job_type.in_(job_types),
+        table.c.status == RUNNING,
+        table.c.lease_expires_at >= func.now(),
+    ))])).scalar()
+    if is_running:
+        return []
+    return claim_jobs(session, worker_id, list(job_types), 1, lease_in_sec)
+
+
+def extend_leases(session, worker_id: str, job_ids: List[int], lease_in_sec: float) -> None:
+    """Heartbeat of the jobs that worker_id is still running"""
+    if len(job_ids) == 0:
+        return
+    table = Jobs.__table__
+    session.execute(table.update().where(and_(
+        table.c.id.in_(job_ids),
+        table.c.locked_by == worker_id,
+        table.c.status == RUNNING,
+    )).values(
+        lease_expires_at=func.now() + timedelta(seconds=lease_in_sec),
+        updated_at=func.now(),
+    ))
+
+
+def complete_job(session, worker_id: str, job_id: int) -> None:
+    """Mark the job done unless its lease has been taken over by another worker"""
+    table = Jobs.__table__
+    session.execute(table.update().where(and_(
+        table.c.id == job_id,
+        table.c.locked_by == worker_id,
+    )).values(status=DONE, lease_expires_at=None, updated_at=func.now()))
+
+
+def fail_job(session, worker_id: str, job_id: int, error: Optional[str]) -> None:
+    """Put the job back to the queue, or mark it failed when it has no attempts left"""
+    table = Jobs.__table__
+    session.execute(table.update().where(and_(
+        table.c.id == job_id,
+        table.c.locked_by == worker_id,
+    )).values(
+        status=case([(table.c.attempts >= table.c.max_attempts, FAILED)], else_=PENDING),
+        locked_by=None,
+        lease_expires_at=None,
+        last_error=error,
+        updated_at=func.now(),
+    ))
+
+
+def count_jobs_by_status(session) -> Dict[str, int]:
+    """Return status -> number of jobs"""
+    table = Jobs.__table__
+    rows = session.execute(
+        table.select().with_only_columns([table.c.status, func.count()]).group_by(table.c.status)
+    )
+    return {status: count for status, count in rows}
+
+
+def has_unfinished_jobs(session, job_types: Sequence[str]) -> bool:
+    """Return True if a job of job_types is pending or running"""
+    table = Jobs.__table__
+    return session.execute(select([exists().where(and_(
+        table.c.job_type.in_(job_types),
+        table.c.status.in_([PENDING, RUNNING]),
+        table.c.attempts < table.c.max_attempts,
+    ))])).scalar()
@@ -0,0 +1,51 @@
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import Column, BigInteger, DateTime, Index, func
+from sqlalchemy.dialects.postgresql import insert
+
+from utils import Base
+
+
+class LikedTweets(Base):
+    """Tweets liked by this account
+
+    Notes:
+        liked_at is None for tweets imported from the favorites list because the time of the like is unknown.
+    """
+
+    __tablename__ = 'liked_tweets'
+    tweet_id = Column('tweet_id', BigInteger, primary_key=True)
+    user_id = Column('user_id', BigInteger)
+    liked_at = Column('liked_at', DateTime)
+
+    __table_args__ = (
+        Index('ix_liked_tweets_liked_at', liked_at),
+    )
+
+
+def fetch_liked_tweet_ids(session, chunk_size: int = 10000) -> Iterator[int]:
+    rows = session.query(LikedTweets.tweet_id).yield_per(chunk_size)
+    return (row.tweet_id for row in rows)
+
+
+def record_liked_tweets(session, rows: List[Dict[str, Any]]) -> None:
+    """Insert rows into liked_tweets and ignore tweets that already exist
+
+    Args:
+        session: db session. Caller is responsible for commit.
+        rows: dicts whose keys are tweet_id, user_id and liked_at
+    """
+    if len(rows) == 0:
+        return
+    statement = insert(LikedTweets.__table__).on_conflict_do_nothing(index_elements=['tweet_id'])
+    session.execute(statement, rows)
+
+
+def count_likes_since(session, since: datetime) -> int:
+    return session.query(LikedTweets).filter(LikedTweets.liked_at > since).count()
+
+
+def fetch_oldest_like_since(session, since: datetime) -> Optional[datetime]:
+    """Time of the oldest like after since. None if there is none."""
+    return session.query(func.min(LikedTweets.liked_at)).filter(LikedTweets.liked_at > since).scalar()
@@ -0,0 +1,86 @@
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import Column, BigInteger, DateTime, String
+from sqlalchemy.dialects.postgresql import insert
+
+from utils import Base
+
+
+class SearchWatermarks(Base):
+    """Tweet ids that the search of a keyword has read
+
+    Notes:
+        Every tweet up to since_id has been read. If gap_max_id is set, a search stopped before
+        reaching since_id: tweets in (since_id, gap_max_id] are still unread and tweets in
+        (gap_max_id, newest_id] have been read.
+    """
+
+    __tablename__ = 'search_watermarks'
+    keyword = Column('keyword', String, primary_key=True)
+    since_id = Column('since_id', BigInteger, nullable=False)
+    gap_max_id = Column('gap_max_id', BigInteger)
+    newest_id = Column('newest_id', BigInteger)
+    updated_at = Column('updated_at', DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class Watermark(NamedTuple):
+    since_id: int
+    gap_max_id: Optional[int] = None
+    newest_id: Optional[int] = None
+
+    @property
+    def has_gap(self) -> bool:
+        return self.gap_max_id is not None
+
+    def is_unread(self, tweet_id: int) -> bool:
+        if self.has_gap:
+            return self.since_id < tweet_id <= self.gap_max_id or tweet_id > self.newest_id
+        return tweet_id > self.since_id
+
+
+def add_watermark_gap_columns(connection) -> None:
+    """Add the gap columns to search_watermarks created before they existed"""
+    connection.execute('ALTER TABLE search_watermarks ADD COLUMN IF NOT EXISTS gap_max_id BIGINT')
+    connection.execute('ALTER TABLE search_watermarks ADD COLUMN IF NOT EXISTS newest_id BIGINT')
+
+
+def fetch_watermarks(session, keywords: List[str]) -> Dict[str, Watermark]:
+    """Return keyword -> watermark. Keywords that have never been searched are not included."""
+    rows = session.query(SearchWatermarks).filter(SearchWatermarks.keyword.in_(keywords)).all()
+    return {
+        row.keyword: Watermark(row.since_id, row.gap_max_id, row.newest_id)
+        for row in rows
+    }
+
+
+def save_watermarks(session, watermarks: Dict[str, Watermark]) -> None:
+    """Upsert watermarks of keywords
+
+    Args:
+        session: db session. Caller is responsible for commit.
+        watermarks: keyword -> watermark after its tweets have been processed
+    """
+    if len(watermarks) == 0:
+        return
+    now = datetime.now()
+    statement = insert(SearchWatermarks.__table__).values([
+        {
+            'keyword': keyword,
+            'since_id': watermark.since_id,
+            'gap_max_id': watermark.gap_max_id,
+            'newest_id': watermark.newest_id,
+            'updated_at': now,
+        }
+        for keyword, watermark in watermarks.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=['keyword'],
+        set_={
+            'since_id': statement.excluded.since_id,
+            'gap_max_id': statement.excluded.gap_max_id,
+            'newest_id': statement.excluded.newest_id,
+            'updated_at': statement.excluded.updated_at,
+        }
+    )
+    session.execute(statement)
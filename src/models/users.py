@@ -1,6 +1,13 @@
-from sqlalchemy import Column, BigInteger, Boolean, String, Integer
+import csv
+import io
+from typing import Any, Dict, Iterable, List, Set
 
-from utils import ENGINE, Base
+from sqlalchemy import Column, BigInteger, Boolean, DateTime, Index, String, Integer, any_, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from utils import get_engine, Base, EXISTENCE_CHECK_CHUNK_SIZE, BULK_COPY_THRESHOLD
+from utils.functions import chunked
+from .search_watermarks import add_watermark_gap_columns
 
 
 class ValuableUsers(Base):
@@ -13,7 +20,125 @@ class ValuableUsers(Base):
     screen_name = Column('screen_name', String)
     is_friend = Column('is_friend', Boolean, default=False)
     num_likes = Column('num_likes', Integer, default=0)
+    # Last time this user was picked as a like candidate. Candidates are rotated by this.
+    last_checked_at = Column('last_checked_at', DateTime)
+
+    __table_args__ = (
+        Index(
+            'ix_valuable_users_num_likes_last_checked_at',
+            num_likes,
+            last_checked_at.asc().nullsfirst()
+        ),
+    )
 
 
 def create_table_unless_exists() -> None:
-    Base.metadata.create_all(bind=ENGINE)
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    # create_all does not change tables that already exist
+    with engine.begin() as connection:
+        connection.execute(
+            'ALTER TABLE valuable_users ADD COLUMN IF NOT EXISTS last_checked_at TIMESTAMP'
+        )
+        add_watermark_gap_columns(connection)
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS ix_valuable_users_num_likes_last_checked_at '
+            'ON valuable_users (num_likes, last_checked_at ASC NULLS FIRST)'
+        )
+
+
+def fetch_existing_user_ids(
+        session,
+        ids: Iterable[int],
+        chunk_size: int = EXISTENCE_CHECK_CHUNK_SIZE
+) -> Set[int]:
+    """Return ids that are already saved in valuable_users
+
+    Args:
+        session: db session
+        ids: user ids to check
+        chunk_size: number of ids checked per query
+
+    Notes:
+        Each chunk is sent as a single array parameter(WHERE id = ANY(:ids))
+        so one round trip checks chunk_size ids.
+    """
+    existing_ids: Set[int] = set()
+    for chunk in chunked(ids, chunk_size):
+        rows = session.query(ValuableUsers.user_id).filter(
+            ValuableUsers.user_id == any_(bindparam('ids', value=chunk, type_=ARRAY(BigInteger)))
+        ).all()
+        existing_ids.update(row.user_id for row in rows)
+    return existing_ids
+
+
+def bulk_insert_valuable_users(
+        session,
+        rows: List[Dict[str, Any]],
+        copy_threshold: int = BULK_COPY_THRESHOLD
+) -> None:
+    """Insert rows into valuable_users and ignore ids that already exist
+
+    Args:
+        session: db session. Caller is responsible for commit.
+        rows: dicts whose keys are id, screen_name, is_friend and num_likes
+        copy_threshold: rows at or above this number are written through COPY
+
+    Notes:
+        Normal batches are written by INSERT ... ON CONFLICT (id) DO NOTHING with executemany.
+        Very large batches are copied into a temp staging table and merged by one statement.
+        Either way concurrent writers of the same user never fail.
+    """
+    if len(rows) == 0:
+        return
+    if len(rows) < copy_threshold:
+        statement = insert(ValuableUsers.__table__).on_conflict_do_nothing(index_elements=['id'])
+        session.execute(statement, rows)
+        return
+
+    columns = ['id', 'screen_name', 'is_friend', 'num_likes']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+
+    cursor = session.connection().connection.cursor()
+    cursor.execute(
+        'CREATE TEMP TABLE IF NOT EXISTS valuable_users_staging '
+        '(LIKE valuable_users INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'
+    )
+    cursor.copy_expert(
+        f'COPY valuable_users_staging ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)',
+        buffer
+    )
+    cursor.execute(
+        f'INSERT INTO valuable_users ({", ".join(columns)}) '
+        f'SELECT {", ".join(columns)} FROM valuable_users_staging '
+        'ON CONFLICT (id) DO NOTHING'
+    )
+    cursor.close()
+
+
+def increment_num_likes(session, deltas: Dict[int, int]) -> None:
+    """Add deltas to num_likes of users in one statement
+
+    Args:
+        session: db session. Caller is responsible for commit.
+        deltas: user id -> number of likes to add
+
+    Notes:
+        The increment is done by db(num_likes = num_likes + delta), so concurrent writers never lose counts.
+    """
+    if len(deltas) == 0:
+        return
+    ids = list(deltas.keys())
+    statement = text(
+        'UPDATE valuable_users AS v SET num_likes = v.num_likes + d.delta '
+        'FROM (SELECT unnest(:ids) AS id, unnest(:deltas) AS delta) AS d '
+        'WHERE v.id = d.id'
+    ).bindparams(
+        bindparam('ids', type_=ARRAY(BigInteger)),
+        bindparam('deltas', type_=ARRAY(Integer)),
+    )
+    session.execute(statement, {'ids': ids, 'deltas': [deltas[id_] for id_ in ids]})
@@ -0,0 +1,93 @@
+import unittest
+from types import SimpleNamespace
+
+from logics.search_planner import advance_watermark, demultiplex
+from models.search_watermarks import Watermark
+
+
+class TestAdvanceWatermark(unittest.TestCase):
+
+    def test_first_search_starts_from_newest_tweet(self):
+        self.assertEqual(advance_watermark(None, None, 0, 500), Watermark(500))
+
+    def test_first_search_without_tweets_saves_nothing(self):
+        self.assertIsNone(advance_watermark(None, None, 0, None))
+
+    def test_walk_that_reached_since_id_moves_it_to_newest(self):
+        self.assertEqual(advance_watermark(Watermark(100), None, 100, 500), Watermark(500))
+
+    def test_tweets_below_last_page_are_kept_as_gap(self):
+        # Pages covered (300, 500], so (100, 300] is still unread
+        watermark = advance_watermark(Watermark(100), None, 300, 500)
+        self.assertEqual(watermark, Watermark(100, 300, 500))
+        self.assertTrue(watermark.is_unread(200))
+        self.assertFalse(watermark.is_unread(400))
+        self.assertTrue(watermark.is_unread(501))
+
+    def test_walk_into_gap_lowers_its_top(self):
+        self.assertEqual(
+            advance_watermark(Watermark(100, 300, 500), 300, 200, 300),
+            Watermark(100, 200, 500)
+        )
+
+    def test_empty_page_in_gap_closes_it(self):
+        # The page below max_id came back empty, so the walk reached since_id
+        self.assertEqual(advance_watermark(Watermark(100, 300, 500), 300, 100, None), Watermark(500))
+
+    def test_empty_page_from_newest_keeps_watermark(self):
+        self.assertEqual(advance_watermark(Watermark(100), None, 100, None), Watermark(100))
+
+    def test_failed_walk_into_gap_keeps_it(self):
+        self.assertEqual(
+            advance_watermark(Watermark(100, 300, 500), 300, 300, None),
+            Watermark(100, 300, 500)
+        )
+
+    def test_walk_that_would_leave_two_gaps_keeps_watermark(self):
+        self.assertEqual(
+            advance_watermark(Watermark(100, 300, 500), None, 600, 800),
+            Watermark(100, 300, 500)
+        )
+
+    def test_gap_walk_does_not_touch_keyword_without_gap(self):
+        self.assertEqual(advance_watermark(Watermark(400), 300, 200, 290), Watermark(400))
+
+
+
+class TestDemultiplex(unittest.TestCase):
+
+    @staticmethod
+    def demultiplexed_texts(texts, keywords):
+        tweets = [SimpleNamespace(full_text=text) for text in texts]
+        return {
+            keyword: [tweet.full_text for tweet in tweets]
+            for keyword, tweets in demultiplex(tweets, keywords).items()
+        }
+
+    def test_ascii_keyword_does_not_match_inside_word(self):
+        self.assertEqual(
+            self.demultiplexed_texts(['he said so', 'send an email', 'AI is fun', 'ai!'], ['AI']),
+            {'AI': ['AI is fun', 'ai!']}
+        )
+
+    def test_ascii_keyword_next_to_japanese_matches(self):
+        self.assertEqual(
+            self.demultiplexed_texts(['生成AIエンジニア', 'Webアプリ作った'], ['AI', 'webアプリ']),
+            {'AI': ['生成AIエンジニア'], 'webアプリ': ['Webアプリ作った']}
+        )
+
+    def test_hashtag_does_not_match_longer_hashtag(self):
+        self.assertEqual(
+            self.demultiplexed_texts(['#プログラミング初心者 です', '#プログラミング初心者歓迎'], ['#プログラミング初心者']),
+            {'#プログラミング初心者': ['#プログラミング初心者 です']}
+        )
+
+    def test_tweet_goes_to_first_keyword_found(self):
+        self.assertEqual(
+            self.demultiplexed_texts(['python and go', 'user name match only'], ['python', 'go']),
+            {'python': ['python and go'], 'go': []}
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1 +1,2 @@
 from .settings import *
+from .database import Base, get_engine, session_scope
@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+
+from .settings import (
+    DB,
+    USER,
+    PASSWORD,
+    HOST,
+    DBNAME,
+    DB_ECHO,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE_IN_SEC,
+)
+from .metrics import DB_STATEMENT_SECONDS
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+# The only session factory. It is bound to the engine when the engine is created.
+SessionFactory = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+)
+session = scoped_session(SessionFactory)
+Base = declarative_base()
+Base.query = session.query_property()
+
+
+def database_url() -> str:
+    return f'{DB}://{USER}:{PASSWORD}@{HOST}/{DBNAME}'
+
+
+def get_engine():
+    """Return the engine. It is created on first use instead of at import time."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            from sqlalchemy.engine import create_engine
+
+            _engine = create_engine(
+                database_url(),
+                encoding="utf-8",
+                echo=DB_ECHO,
+                executemany_mode='values',
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_pre_ping=DB_POOL_PRE_PING,
+                pool_recycle=DB_POOL_RECYCLE_IN_SEC,
+            )
+            event.listen(_engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(_engine, 'after_cursor_execute', _after_cursor_execute)
+            SessionFactory.configure(bind=_engine)
+    return _engine
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['statement_started_at'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info.pop('statement_started_at', None)
+    if started_at is None:
+        return
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'EMPTY'
+    DB_STATEMENT_SECONDS.labels(keyword).observe(time.perf_counter() - started_at)
+
+
+@contextmanager
+def session_scope():
+    """Unit of work. Commit on success, rollback on error and always close.
+
+    Examples:
+        >>>with session_scope() as session:
+        >>>    session.query(ValuableUsers).count()
+
+    Notes:
+        Objects stay readable after the scope because they are not expired on commit.
+    """
+    get_engine()
+    session_ = SessionFactory()
+    try:
+        yield session_
+        session_.commit()
+    except Exception:
+        session_.rollback()
+        raise
+    finally:
+        session_.close()
@@ -1,4 +1,8 @@
-from typing import List
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+
+T = TypeVar('T')
 
 
 def calc_page(resource_num: int, request_limit_num: int):
@@ -17,3 +21,84 @@ def calc_page(resource_num: int, request_limit_num: int):
 def parse_target_users(text_file: str) -> List[str]:
     f = open(text_file)
     return f.read().splitlines()
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Split iterable into lists whose length is at most size
+
+    Args:
+        iterable: items to split
+        size: max number of items per chunk
+
+    Examples:
+        >>> list(chunked(range(5), 2))
+        [[0, 1], [2, 3], [4]]
+    """
+    chunk: List[T] = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def split_by_weights(total: int, weights: Dict[T, int], at_least_one: bool = False) -> Dict[T, int]:
+    """Split total into integer shares proportional to weights
+
+    Args:
+        total: number to split
+        weights: key -> weight
+        at_least_one: give 1 to every key with weight > 0 while total > 0,
+            even if the shares then add up to more than total
+
+    Returns:
+        key -> share. Shares are rounded by the largest remainder, so they add up to total
+        unless at_least_one raised some of them.
+
+    Examples:
+        >>> split_by_weights(1, {'a': 1, 'b': 1})
+        {'a': 1, 'b': 0}
+        >>> split_by_weights(1, {'a': 1, 'b': 1}, at_least_one=True)
+        {'a': 1, 'b': 1}
+    """
+    total_weight = sum(weights.values())
+    if total <= 0 or total_weight <= 0:
+        return {key: 0 for key in weights}
+    exact = {key: total * weight / total_weight for key, weight in weights.items()}
+    shares = {key: int(share) for key, share in exact.items()}
+    by_remainder = sorted(weights, key=lambda key: exact[key] - shares[key], reverse=True)
+    for key in by_remainder[:total - sum(shares.values())]:
+        shares[key] += 1
+    if at_least_one:
+        for key, weight in weights.items():
+            if weight > 0:
+                shares[key] = max(shares[key], 1)
+    return shares
+
+
+class LazyAttribute:
+    """Class attribute that is created by factory on first access
+
+    Examples:
+        >>> class Logic:
+        ...     twitter = LazyAttribute(TwitterClient)
+        >>> Logic().twitter is Logic().twitter
+        True
+
+    Notes:
+        The value is shared by every instance of the class like a normal class attribute.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._lock = threading.Lock()
+
+    def __get__(self, instance, owner) -> T:
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+        return self._value
@@ -0,0 +1,65 @@
+import threading
+from typing import Iterable
+
+import numpy as np
+
+from .id_set import IdSet, IdsLike
+
+
+class KnownIdIndex:
+    """In-process index of ids that are known to exist in a table
+
+    Notes:
+        Ids are kept in an IdSet (8 bytes per id). Ids added after the last compaction
+        are merged into a second, small IdSet, so an add does not copy the large one.
+        A hit means the id definitely exists. A miss has to be confirmed by db
+        because other processes can insert rows at any time.
+    """
+
+    def __init__(self, compact_threshold: int = 100000):
+        self._sorted = IdSet()
+        self._recent = IdSet()
+        self._compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self.is_loaded = False
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._recent)
+
+    def __contains__(self, id_: int) -> bool:
+        return id_ in self._recent or id_ in self._sorted
+
+    def contains_many(self, ids: IdsLike) -> np.ndarray:
+        """Boolean mask of ids that are known. The order of ids is kept."""
+        ids = IdSet.to_array(ids)
+        with self._lock:
+            sorted_ids, recent = self._sorted, self._recent
+        return sorted_ids.contains_many(ids) | recent.contains_many(ids)
+
+    def load(self, ids: Iterable[int]) -> None:
+        """Replace the whole index with ids
+
+        Args:
+            ids: every id that exists in the table
+        """
+        sorted_ids = IdSet(np.fromiter(ids, dtype=np.int64))
+        with self._lock:
+            self._sorted = sorted_ids
+            self._recent = IdSet()
+            self.is_loaded = True
+
+    def add_many(self, ids: Iterable[int]) -> None:
+        """Register ids that have been confirmed to exist
+
+        Args:
+            ids: ids found in or written to the table
+        """
+        ids = IdSet.to_array(ids)
+        with self._lock:
+            self._recent = self._recent.union(ids[~self._sorted.contains_many(ids)])
+            if len(self._recent) >= self._compact_threshold:
+                self._compact()
+
+    def _compact(self) -> None:
+        self._sorted = self._sorted.union(self._recent)
+        self._recent = IdSet()
@@ -0,0 +1,117 @@
+from typing import Iterable, Iterator, List, Union
+
+import numpy as np
+
+
+IdsLike = Union['IdSet', np.ndarray, Iterable[int]]
+
+
+def _sorted_unique(ids: np.ndarray) -> np.ndarray:
+    """Sort ids and drop duplicates"""
+    sorted_ids = np.sort(ids)
+    if len(sorted_ids) == 0:
+        return sorted_ids
+    is_first = np.empty(len(sorted_ids), dtype=np.bool_)
+    is_first[0] = True
+    np.not_equal(sorted_ids[1:], sorted_ids[:-1], out=is_first[1:])
+    return sorted_ids[is_first]
+
+
+def _sorted_contains(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Boolean mask of ids that are in sorted_ids"""
+    if len(sorted_ids) == 0:
+        return np.zeros(len(ids), dtype=np.bool_)
+    positions = np.searchsorted(sorted_ids, ids)
+    positions[positions == len(sorted_ids)] = 0
+    return sorted_ids[positions] == ids
+
+
+class IdSet:
+    """Immutable set of int64 ids backed by a sorted numpy array
+
+    Notes:
+        An id costs 8 bytes instead of 60-90 bytes in set[int].
+        Set algebra works on whole arrays, so millions of ids are merged in milliseconds.
+        Iteration yields python ints in ascending order.
+    """
+
+    __slots__ = ('_ids',)
+
+    def __init__(self, ids: IdsLike = ()):
+        if isinstance(ids, IdSet):
+            self._ids = ids._ids
+        else:
+            self._ids = _sorted_unique(self.to_array(ids))
+
+    @staticmethod
+    def to_array(ids: IdsLike) -> np.ndarray:
+        if isinstance(ids, IdSet):
+            return ids._ids
+        if isinstance(ids, np.ndarray):
+            return ids.astype(np.int64, copy=False)
+        if not isinstance(ids, (list, tuple)):
+            ids = list(ids)
+        return np.array(ids, dtype=np.int64)
+
+    @classmethod
+    def _from_sorted(cls, sorted_ids: np.ndarray) -> 'IdSet':
+        id_set = cls.__new__(cls)
+        id_set._ids = sorted_ids
+        return id_set
+
+    @classmethod
+    def union_all(cls, id_sets: Iterable[IdsLike]) -> 'IdSet':
+        """Union of any number of id sets or pages of ids in one merge"""
+        arrays = [cls.to_array(ids) for ids in id_sets]
+        if len(arrays) == 0:
+            return cls()
+        return cls._from_sorted(_sorted_unique(np.concatenate(arrays)))
+
+    @property
+    def array(self) -> np.ndarray:
+        """Sorted ids. Do not modify it."""
+        return self._ids
+
+    @property
+    def nbytes(self) -> int:
+        return self._ids.nbytes
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids.tolist())
+
+    def __contains__(self, id_: int) -> bool:
+        idx = int(np.searchsorted(self._ids, id_))
+        return idx < len(self._ids) and self._ids[idx] == id_
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, IdSet):
+            return NotImplemented
+        return np.array_equal(self._ids, other._ids)
+
+    def __repr__(self) -> str:
+        return f'IdSet(size={len(self)})'
+
+    def contains_many(self, ids: IdsLike) -> np.ndarray:
+        """Boolean mask of ids that are in this set. The order of ids is kept."""
+        return _sorted_contains(self._ids, self.to_array(ids))
+
+    def union(self, *others: IdsLike) -> 'IdSet':
+        return self.union_all([self, *others])
+
+    def difference(self, other: IdsLike) -> 'IdSet':
+        other_ids = IdSet(other)._ids
+        return self._from_sorted(self._ids[~_sorted_contains(other_ids, self._ids)])
+
+    def intersection(self, other: IdsLike) -> 'IdSet':
+        other_ids = IdSet(other)._ids
+        return self._from_sorted(self._ids[_sorted_contains(other_ids, self._ids)])
+
+    __or__ = union
+    __sub__ = difference
+    __and__ = intersection
+
+    def tolist(self) -> List[int]:
+        return self._ids.tolist()
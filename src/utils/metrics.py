@@ -0,0 +1,98 @@
+"""Prometheus metrics of the bot
+
+Notes:
+    Counters and histograms below are updated on the hot path and cost a few microseconds each.
+    Quota and cache figures are not updated on the hot path. They are read from
+    the stats() of their registries when prometheus scrapes the endpoint.
+"""
+import threading
+from typing import Callable, Dict, Iterator, Sequence, Tuple, Union
+
+from prometheus_client import Counter, Histogram, start_http_server
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+
+TWITTER_REQUESTS = Counter(
+    'twitter_requests_total',
+    'Calls of twitter endpoints by the status code of the last response',
+    ['endpoint', 'status'],
+)
+TWITTER_REQUEST_SECONDS = Histogram(
+    'twitter_request_seconds',
+    'Latency of calls of twitter endpoints including retries',
+    ['endpoint'],
+)
+DB_STATEMENT_SECONDS = Histogram(
+    'db_statement_seconds',
+    'Latency of SQL statements by their first keyword',
+    ['statement'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, float('inf')),
+)
+PIPELINE_USERS = Counter(
+    'pipeline_users_total',
+    'Users that reached a stage of a pipeline',
+    ['pipeline', 'stage'],
+)
+JOBS = Counter(
+    'jobs_total',
+    'Jobs of the queue run by this worker by their result',
+    ['job_type', 'result'],
+)
+LIKES = Counter(
+    'likes_total',
+    'Tweets liked',
+    ['pipeline'],
+)
+
+
+class StatsCollector:
+    """Expose stats() of a registry as gauges at scrape time
+
+    Args:
+        prefix: prefix of the metric names
+        stats: function that returns key -> {figure name -> number}.
+            A key is a tuple of label values if there are several labels.
+        labels: label names of the key
+    """
+
+    def __init__(
+            self,
+            prefix: str,
+            stats: Callable[[], Dict[Union[str, Tuple[str, ...]], Dict[str, Union[int, float, bool]]]],
+            labels: Sequence[str]
+    ):
+        self._prefix = prefix
+        self._stats = stats
+        self._labels = list(labels)
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        families: Dict[str, GaugeMetricFamily] = {}
+        for key, figures in self._stats().items():
+            label_values = list(key) if isinstance(key, tuple) else [key]
+            for name, value in figures.items():
+                if name not in families:
+                    families[name] = GaugeMetricFamily(
+                        f'{self._prefix}_{name}',
+                        f'{name} of {self._prefix} per {", ".join(self._labels)}',
+                        labels=self._labels,
+                    )
+                families[name].add_metric(label_values, float(value))
+        return iter(families.values())
+
+
+def register_stats(prefix: str, stats: Callable, labels: Sequence[str] = ('endpoint',)) -> None:
+    REGISTRY.register(StatsCollector(prefix, stats, labels))
+
+
+_server_lock = threading.Lock()
+_is_server_started = False
+
+
+def start_metrics_server(port: int) -> None:
+    """Serve metrics in prometheus text format on port. Calls after the first are ignored."""
+    global _is_server_started
+    with _server_lock:
+        if _is_server_started:
+            return
+        start_http_server(port)
+        _is_server_started = True
@@ -1,9 +1,5 @@
 import os
-from typing import List, Tuple
-
-from sqlalchemy.engine import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+from typing import Dict, List, Tuple
 
 
 DEBUG = True
@@ -15,48 +11,35 @@ USER = 'user_dev'
 PASSWORD = 'pass_dev'
 HOST = 'db:5432'
 DBNAME = 'develop_db'
-ECHO = True
 if not DEBUG:
     DB = os.environ['DB'],
     USER = os.environ['USER'],
     HOST = os.environ['HOST'],
     PASSWORD = os.environ['PASSWORD'],
     DBNAME = os.environ['DBNAME'],
-    ECHO = False
-
-ENGINE = create_engine(
-    f'{DB}://{USER}:{PASSWORD}@{HOST}/{DBNAME}',
-    encoding="utf-8",
-    echo=ECHO
-)
-session = scoped_session(
-    sessionmaker(
-        autocommit=False,
-        autoflush=False,
-        bind=ENGINE
-    )
-)
-Base = declarative_base()
-Base.query = session.query_property()
-
-
-# Twitter secrets
-CONSUMER_KEY = os.environ['CONSUMER_KEY']
-CONSUMER_SECRET = os.environ['CONSUMER_SECRET']
-ACCESS_TOKEN = os.environ['ACCESS_TOKEN']
-ACCESS_TOKEN_SECRET = os.environ['ACCESS_TOKEN_SECRET']
+# Log every SQL statement. Keep it off except for debugging because it is on the hot path.
+DB_ECHO = os.environ.get('DB_ECHO', 'false').lower() == 'true'
+# Connection pool. Threads of TWITTER_MAX_WORKERS and the event loop share it.
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 5
+DB_POOL_PRE_PING = True
+DB_POOL_RECYCLE_IN_SEC = 30 * 60
+
+
+# Twitter secrets. Empty values let tools such as benchmarks import settings without credentials.
+CONSUMER_KEY = os.environ.get('CONSUMER_KEY', '')
+CONSUMER_SECRET = os.environ.get('CONSUMER_SECRET', '')
+ACCESS_TOKEN = os.environ.get('ACCESS_TOKEN', '')
+ACCESS_TOKEN_SECRET = os.environ.get('ACCESS_TOKEN_SECRET', '')
+# Extra accounts that read endpoints are shared with. A json file of a list of
+# {"consumer_key": ..., "consumer_secret": ..., "access_token": ..., "access_token_secret": ...}
+TWITTER_EXTRA_CREDENTIALS_FILE = os.environ.get('TWITTER_EXTRA_CREDENTIALS_FILE')
+# Host of the v1.1 API. Benchmarks point it to a local fake server.
+TWITTER_API_HOST = os.environ.get('TWITTER_API_HOST', 'api.twitter.com')
 
 # Slack secrets
-SLACK_TOKEN = os.environ['SLACK_TOKEN']
-
-if DEBUG:
-    print(
-        f'CONSUMER_KEY:{CONSUMER_KEY}'
-        f'CONSUMER_SECRET:{CONSUMER_SECRET}'
-        f'ACCESS_TOKEN:{ACCESS_TOKEN}'
-        f'ACCESS_TOKEN_SECRET:{ACCESS_TOKEN_SECRET}'
-        f'SLACK_TOKEN: {SLACK_TOKEN}'
-    )
+SLACK_TOKEN = os.environ.get('SLACK_TOKEN', '')
+SLACK_API_URL = os.environ.get('SLACK_API_URL', 'https://slack.com/api/chat.postMessage')
 
 
 # Total number of importance has to be less than limit(1000) - 500(like_tweet_from_users_in_db) = 500
@@ -85,13 +68,96 @@ TARGET_KEYWORD_AND_IMPORTANCE: List[Tuple[str, int]] = [
 ]
 
 
+# Search
+SEARCH_QUERY_MAX_LENGTH = 500
+SEARCH_PAGES_PER_PLAN = 2
+# Keywords of a plan share its pages. Fewer tweets per keyword and cycle are read than
+# by one search per keyword, but tweets below the last page are kept as a gap of the
+# watermark and read in the next cycles, so none are lost.
+SEARCH_KEYWORDS_PER_PLAN = 5
+
+
 # Client
 REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND = 60 * 15
 RETRY_NUM = 3
 LIKE_LIMIT_PER_DAY = 150
+# Like slots that can be saved up and used at once
+LIKE_BURST = 10
+# Wait before checking the budget again once it has been used up
+LIKE_BUDGET_RETRY_IN_SEC = 15 * 60
+# Share of the daily like budget per pipeline
+LIKE_PIPELINE_WEIGHTS: Dict[str, int] = {
+    'db_users': 1,
+    'keyword': 1,
+}
+TWITTER_MAX_WORKERS = 8
+USERS_LOOKUP_LIMIT = 100
+# Response cache. Entries of endpoints not listed here expire immediately.
+CACHE_TTL_IN_SEC: Dict[str, float] = {
+    '/users/show/:id': 6 * 60 * 60,
+    '/statuses/user_timeline': 30 * 60,
+}
+CACHE_MAX_SIZE = 100000
+# Directory of on-disk cache that survives restarts. None disables it.
+CACHE_DISK_DIR = os.environ.get('CACHE_DISK_DIR')
+# Requests per window used until the first response tells the actual quota
+RATE_LIMIT_DEFAULTS: Dict[str, int] = {
+    '/search/tweets': 180,
+    '/users/show/:id': 900,
+    '/users/lookup': 900,
+    '/statuses/user_timeline': 900,
+    '/followers/ids': 15,
+    '/favorites/create': 15,
+    '/favorites/list': 75,
+}
+# Interval of the report of throttled endpoints to slack
+RATE_LIMIT_REPORT_INTERVAL_IN_SEC = 60 * 60
+
+
+# Prometheus metrics. docker-compose publishes this port of src.
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 8000))
+
+
+# Slack notification
+SLACK_COALESCE_WINDOW_IN_SEC = 1.0
+SLACK_MIN_INTERVAL_PER_CHANNEL_IN_SEC = 1.0
+SLACK_MAX_MESSAGE_LENGTH = 3000
+
+
+# Evaluation thresholds
+EVALUATE_MIN_FOLLOWERS = 10
+EVALUATE_MIN_FRIENDS = 10
+EVALUATE_MIN_FAVOURITES = 10
+EVALUATE_MIN_DESCRIPTION_LENGTH = 10
+EVALUATE_ACTIVE_WITHIN_DAYS = 30
+EVALUATE_MAX_FAVORITE_COUNT = 10
+EVALUATE_MAX_RETWEET_COUNT = 10
+# Number of users evaluated concurrently. Timeline requests run on TWITTER_MAX_WORKERS threads.
+EVALUATE_WORKERS = 8
 
 
 # Settings for logics
+# Legacy progress file. Targets in it are imported into harvest_checkpoints as completed.
 DUMPED_FILE = 'target_lists/dumped_users.txt'
 DB_LIKES = 50
 NUM_PER_BATCH = 100
+EXISTENCE_CHECK_CHUNK_SIZE = 10000
+USE_KNOWN_USER_INDEX = True
+BULK_COPY_THRESHOLD = 5000
+LIKE_COUNTER_FLUSH_THRESHOLD = 50
+LIKE_COUNTER_FLUSH_INTERVAL_IN_SEC = 60
+
+
+# Job queue in db. With USE_JOB_QUEUE=true any number of bot containers split the work.
+USE_JOB_QUEUE = os.environ.get('USE_JOB_QUEUE', 'false').lower() == 'true'
+# A job goes back to the queue if its worker does not heartbeat within this
+JOB_LEASE_IN_SEC = 5 * 60
+JOB_HEARTBEAT_INTERVAL_IN_SEC = 60
+JOB_MAX_ATTEMPTS = 5
+# Jobs claimed and run concurrently by a worker
+JOB_CLAIM_BATCH = 4
+JOB_POLL_INTERVAL_IN_SEC = 10
+
+
+# Benchmarks
+IMPORT_TIME_BUDGET_IN_SEC = 1.0